@@ -5,11 +5,13 @@ Implementa processamento paralelo usando ThreadPoolExecutor para otimizar perfor
 """
 
 import requests
+import threading
 import time
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import List, Dict, Optional, Tuple
 import pandas as pd
 import numpy as np
+from src.http_retry import mount_adapter, retrying_adapter
 
 # Tenta importar Streamlit para cache (opcional)
 try:
@@ -26,6 +28,42 @@ except ImportError:
         return func
 
 
+class RateLimiter:
+    """
+    Limitador de taxa thread-safe (token bucket).
+    
+    Permite até ``calls`` requisições por janela de ``per`` segundos, com
+    rajadas de até ``calls``. Threads só bloqueiam quando o balde esvazia.
+    """
+    
+    def __init__(self, calls: int, per: float = 1.0):
+        """
+        Args:
+            calls: Número máximo de chamadas por janela
+            per: Duração da janela em segundos
+        """
+        if calls <= 0 or per <= 0:
+            raise ValueError("calls e per devem ser positivos")
+        self.capacity = float(calls)
+        self.rate = calls / per
+        self._tokens = float(calls)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+    
+    def acquire(self):
+        """Bloqueia até haver um token disponível e o consome."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
 class IEDBClient:
     """Cliente para API do IEDB (Immune Epitope Database)."""
     
@@ -239,36 +277,54 @@ class UniProtClient:
 class APIClientManager:
     """Gerenciador de clientes de API com processamento paralelo."""
     
-    def __init__(self, max_workers: int = 5, request_delay: float = 0.1):
+    def __init__(self, max_workers: int = 5, request_delay: float = 0.1,
+                 rate_limiter: Optional[RateLimiter] = None, max_retries: int = 0):
         """
         Inicializa gerenciador de APIs.
         
         Args:
             max_workers: Número máximo de threads para processamento paralelo
-            request_delay: Delay entre requisições (segundos) para evitar rate limiting
+            request_delay: Delay entre requisições (segundos) para evitar rate limiting;
+                ignorado quando ``rate_limiter`` é fornecido
+            rate_limiter: Limitador compartilhado pelas threads (ex: RateLimiter(10, per=1))
+            max_retries: Tentativas extras com backoff exponencial para respostas
+                429/5xx e falhas de conexão (0 desativa)
         """
         self.max_workers = max_workers
         self.request_delay = request_delay
+        self.rate_limiter = rate_limiter
         self.iedb_client = IEDBClient()
         self.uniprot_client = UniProtClient()
+        
+        if max_retries > 0:
+            adapter = retrying_adapter(max_retries, pool_maxsize=max_workers)
+            for session in (self.iedb_client.session, self.uniprot_client.session):
+                mount_adapter(session, adapter)
+    
+    def _throttle(self):
+        """Aguarda a vez da requisição (token bucket ou delay fixo)."""
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire()
+        else:
+            time.sleep(self.request_delay)
     
     def _predict_immunogenicity_wrapper(self, args: Tuple[str, str]) -> Tuple[str, Optional[float]]:
         """Wrapper para predição de imunogenicidade."""
         peptide, allele = args
-        time.sleep(self.request_delay)  # Rate limiting
+        self._throttle()  # Rate limiting
         score = self.iedb_client.predict_immunogenicity(peptide, allele)
         return peptide, score
     
     def _predict_affinity_wrapper(self, args: Tuple[str, str, str]) -> Tuple[str, Optional[float]]:
         """Wrapper para predição de afinidade."""
         peptide, allele, method = args
-        time.sleep(self.request_delay)
+        self._throttle()
         affinity = self.iedb_client.predict_affinity(peptide, allele, method)
         return peptide, affinity
     
     def _search_sequence_wrapper(self, peptide: str) -> Tuple[str, Optional[Dict]]:
         """Wrapper para busca de sequência."""
-        time.sleep(self.request_delay)
+        self._throttle()
         result = self.uniprot_client.search_sequence(peptide)
         return peptide, result
     
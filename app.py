@@ -387,17 +387,14 @@ class ImmunoEpitopeApp:
                     try:
                         report_gen = PDFReportGenerator()
                         
-                        # Gera o relatório
-                        pdf_path = report_gen.generate_report(
+                        # Gera o relatório em memória (sem arquivo temporário)
+                        pdf_bytes = report_gen.generate_report(
                             fasta_data=st.session_state.fasta_data,
                             analysis_results=st.session_state.analysis_results,
                             parameters=st.session_state.analysis_results['parameters']
                         )
                         
                         # Disponibiliza para download
-                        with open(pdf_path, "rb") as pdf_file:
-                            pdf_bytes = pdf_file.read()
-                        
                         st.download_button(
                             label="⬇️ Baixar Relatório PDF",
                             data=pdf_bytes,
@@ -4,13 +4,126 @@ Módulo de análise de conservação de sequências.
 Calcula conservação usando múltiplos métodos.
 """
 
+import math
+import os
 import pandas as pd
 import numpy as np
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
 from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
 from Bio import Align
 from Bio.Align import substitution_matrices
 
+# Tenta importar Numba (opcional) para o kernel Smith-Waterman compilado
+try:
+    from numba import njit, prange, set_num_threads
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+
+# Matriz BLOSUM62 e tabela ASCII -> índice (caracteres fora do alfabeto = -1)
+_BLOSUM62 = substitution_matrices.load("BLOSUM62")
+_BLOSUM = np.asarray(_BLOSUM62, dtype=np.int16)
+_AA_IDX = np.full(128, -1, dtype=np.int8)
+for _i, _aa in enumerate(_BLOSUM62.alphabet):
+    _AA_IDX[ord(_aa)] = _i
+
+
+def _encode_sequences(sequences: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Codifica sequências como índices da BLOSUM62 em um único buffer.
+    
+    Args:
+        sequences: Lista de sequências
+        
+    Returns:
+        Tupla (buffer concatenado int8, offsets int64 com len(sequences) + 1 posições)
+    """
+    lengths = np.fromiter((len(s) for s in sequences), dtype=np.int64, count=len(sequences))
+    offsets = np.zeros(len(sequences) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    
+    # 'replace' mantém 1 byte por caractere; não-ASCII vira '?' (índice -1)
+    raw = np.frombuffer(''.join(sequences).encode('ascii', errors='replace'), dtype=np.uint8)
+    return _AA_IDX[raw], offsets
+
+
+if NUMBA_AVAILABLE:
+    @njit(cache=True, parallel=True)
+    def _sw_batch(profile, refs_flat, ref_offsets, ref_ids, gap_open, gap_ext):
+        """
+        Smith-Waterman local com gaps afins (Gotoh) do peptídeo contra várias referências.
+        
+        ``profile`` é o query profile do peptídeo, (alfabeto, L): a linha ``b`` traz os
+        scores de substituição do resíduo ``b`` da referência contra cada posição do
+        peptídeo, lida de forma contígua na coluna da DP.
+        
+        Retorna o score ótimo por referência (NaN se a referência contém
+        caracteres fora do alfabeto da matriz, como o PairwiseAligner rejeitaria).
+        """
+        m = profile.shape[1]
+        out = np.empty(ref_ids.shape[0], dtype=np.float32)
+        for k in prange(ref_ids.shape[0]):
+            r = ref_ids[k]
+            H = np.zeros(m + 1, dtype=np.float32)
+            E = np.full(m + 1, -1e9, dtype=np.float32)
+            best = np.float32(0.0)
+            valid = True
+            for j in range(ref_offsets[r], ref_offsets[r + 1]):
+                b = refs_flat[j]
+                if b < 0:
+                    valid = False
+                    break
+                scores = profile[b]
+                diag = np.float32(0.0)
+                h_up = np.float32(0.0)
+                F = np.float32(-1e9)
+                for i in range(1, m + 1):
+                    old = H[i]
+                    e = max(old + gap_open, E[i] + gap_ext)
+                    E[i] = e
+                    F = max(h_up + gap_open, F + gap_ext)
+                    h = max(diag + scores[i - 1], e, F, np.float32(0.0))
+                    diag = old
+                    H[i] = h
+                    h_up = h
+                    if h > best:
+                        best = h
+            out[k] = best if valid else np.nan
+        return out
+
+
+# Tabelas para entropia sem logaritmos no laço interno. Com contagens k e total n:
+# H = -sum(k/n * log2(k/n)) = log2(n) - sum(k * log2(k)) / n
+_ENTROPY_LUT_N = 4096
+_LOG2_LUT = np.zeros(_ENTROPY_LUT_N + 1)
+_LOG2_LUT[1:] = np.log2(np.arange(1, _ENTROPY_LUT_N + 1))
+_KLOG2K_LUT = np.arange(_ENTROPY_LUT_N + 1) * _LOG2_LUT
+
+
+def _entropy_from_counts(counts: np.ndarray) -> np.ndarray:
+    """
+    Entropia de Shannon a partir de contagens por símbolo (eixo 0) via tabelas.
+    
+    Args:
+        counts: Contagens inteiras, shape (n_simbolos,) ou (n_simbolos, n_colunas)
+        
+    Returns:
+        Entropia por coluna (0 para colunas vazias)
+    """
+    total = counts.sum(axis=0)
+    if total.max(initial=0) <= _ENTROPY_LUT_N:
+        log2_total, klog2k = _LOG2_LUT[total], _KLOG2K_LUT[counts]
+    else:
+        # Fora da tabela: mesma fórmula calculada diretamente
+        log2_total = np.log2(np.maximum(total, 1))
+        klog2k = counts * np.log2(np.maximum(counts, 1))
+    
+    entropy = log2_total - klog2k.sum(axis=0) / np.maximum(total, 1)
+    # Remove resíduos de ponto flutuante (coluna com um único símbolo)
+    return np.where(entropy > 1e-12, entropy, 0.0)
+
 
 def calculate_shannon_entropy(sequences: List[str]) -> float:
     """
@@ -26,26 +139,34 @@ def calculate_shannon_entropy(sequences: List[str]) -> float:
         return 0.0
     
     # Conta frequência de cada aminoácido
-    counter = Counter(sequences)
-    total = len(sequences)
-    
-    # Calcula entropia
-    entropy = 0.0
-    for count in counter.values():
-        p = count / total
-        if p > 0:
-            entropy -= p * np.log2(p)
+    counts = np.fromiter(Counter(sequences).values(), dtype=np.int64)
     
-    return entropy
+    return float(_entropy_from_counts(counts))
+
+
+def _kmer_set(sequence: str, k: int = 3) -> set:
+    """Conjunto de k-meros de uma sequência."""
+    return {sequence[i:i + k] for i in range(len(sequence) - k + 1)}
 
 
-def calculate_conservation_score(peptide: str, reference_sequences: List[str]) -> Dict[str, float]:
+def calculate_conservation_score(peptide: str, reference_sequences: List[str],
+                                 encoded_references: Optional[Tuple[np.ndarray, np.ndarray]] = None,
+                                 reference_kmers: Optional[List[set]] = None,
+                                 min_kmer_overlap: Optional[float] = None) -> Dict[str, float]:
     """
     Calcula score de conservação de um peptídeo em relação a sequências de referência.
     
     Args:
         peptide: Sequência do peptídeo
         reference_sequences: Lista de sequências de referência (proteoma, etc.)
+        encoded_references: Saída de _encode_sequences(reference_sequences); se fornecida
+            e o Numba estiver disponível, usa o kernel compilado em vez do Biopython
+        reference_kmers: Conjuntos de 3-meros de cada referência (pré-calculados por proteoma)
+        min_kmer_overlap: Aproximação opcional: fração mínima de 3-meros do peptídeo
+            presentes na referência para alinhar; abaixo disso a identidade é apenas
+            estimada pela fração, o que subestima o score. None (padrão) ou 0 alinham
+            todas as referências sem ocorrência exata, com resultado idêntico ao
+            PairwiseAligner
         
     Returns:
         Dicionário com scores de conservação
@@ -61,24 +182,80 @@ def calculate_conservation_score(peptide: str, reference_sequences: List[str]) -
     # Alinha peptídeo com cada sequência de referência
     aligner = Align.PairwiseAligner()
     aligner.mode = 'local'
-    aligner.substitution_matrix = substitution_matrices.load("BLOSUM62")
+    aligner.substitution_matrix = _BLOSUM62
     
     identities = []
     matches = 0
     
-    for ref_seq in reference_sequences:
-        try:
-            alignments = aligner.align(peptide, ref_seq)
-            if alignments:
-                alignment = alignments[0]
-                # Calcula identidade
-                identity = alignment.score / (len(peptide) * 2)  # Normalizado
-                identities.append(identity)
-                
-                if identity > 0.8:  # 80% de identidade
-                    matches += 1
-        except:
+    # Pré-filtros antes do alinhamento (SW é O(|pep|·|ref|)):
+    # 1) ocorrência exata via busca de substring (em C) -> identidade do auto-alinhamento
+    # 2) apenas se min_kmer_overlap for dado: sobreposição de 3-meros abaixo do mínimo
+    #    -> identidade estimada pela fração de 3-meros compartilhados, sem alinhar
+    #    (aproximação; ausência de 3-meros em comum não implica score 0, pois a
+    #    BLOSUM62 pontua substituições e matches isolados)
+    exact_hits = [peptide in ref_seq for ref_seq in reference_sequences]
+    exact_identity = aligner.score(peptide, peptide) / (len(peptide) * 2)
+    if min_kmer_overlap:
+        peptide_kmers = _kmer_set(peptide)
+        n_kmers = len(peptide_kmers)
+        min_overlap = math.ceil(min_kmer_overlap * n_kmers)
+    else:
+        n_kmers = 0
+    
+    to_align = []
+    for idx, (ref_seq, exact_hit) in enumerate(zip(reference_sequences, exact_hits)):
+        if exact_hit:
+            identities.append(exact_identity)
+            if exact_identity > 0.8:
+                matches += 1
             continue
+        
+        if n_kmers:
+            if reference_kmers is not None:
+                overlap = len(peptide_kmers & reference_kmers[idx])
+            else:
+                overlap = sum(kmer in ref_seq for kmer in peptide_kmers)
+            if overlap < min_overlap:
+                identities.append(exact_identity * overlap / n_kmers)
+                continue
+        
+        to_align.append(idx)
+    
+    pep_codes = None
+    if NUMBA_AVAILABLE and encoded_references is not None:
+        pep_codes = _encode_sequences([peptide])[0]
+        if (pep_codes < 0).any():
+            pep_codes = None
+    
+    if to_align and pep_codes is not None:
+        # Kernel compilado: um único chamado por peptídeo para todas as referências
+        refs_flat, ref_offsets = encoded_references
+        # Query profile montado uma vez por peptídeo e reutilizado em todas as referências
+        profile = np.ascontiguousarray(_BLOSUM[:, pep_codes], dtype=np.float32)
+        scores = _sw_batch(profile, refs_flat, ref_offsets, np.asarray(to_align, dtype=np.int64),
+                           np.float32(aligner.open_gap_score), np.float32(aligner.extend_gap_score))
+        for score in scores:
+            # Score 0: o PairwiseAligner não retorna alinhamentos e a referência é ignorada
+            if np.isnan(score) or score <= 0:
+                continue
+            identity = float(score) / (len(peptide) * 2)  # Normalizado
+            identities.append(identity)
+            if identity > 0.8:  # 80% de identidade
+                matches += 1
+    else:
+        for idx in to_align:
+            try:
+                alignments = aligner.align(peptide, reference_sequences[idx])
+                if alignments:
+                    alignment = alignments[0]
+                    # Calcula identidade
+                    identity = alignment.score / (len(peptide) * 2)  # Normalizado
+                    identities.append(identity)
+                    
+                    if identity > 0.8:  # 80% de identidade
+                        matches += 1
+            except:
+                continue
     
     if not identities:
         return {
@@ -103,6 +280,36 @@ def calculate_conservation_score(peptide: str, reference_sequences: List[str]) -
     }
 
 
+# Estado por processo dos workers de conservação (preenchido pelo initializer,
+# para que as referências sejam enviadas uma vez por processo e não por tarefa)
+_WORKER_STATE: Dict[str, object] = {}
+
+# Abaixo deste número de peptídeos o custo de subir os processos não compensa
+_MIN_PEPTIDES_PARALLEL = 64
+
+
+def _init_conservation_worker(reference_sequences: List[str],
+                              min_kmer_overlap: Optional[float] = None) -> None:
+    """Initializer do pool: prepara referências codificadas e 3-meros no processo."""
+    if NUMBA_AVAILABLE:
+        # O paralelismo vem dos processos; evita disputa com as threads do kernel
+        set_num_threads(1)
+    _WORKER_STATE['reference_sequences'] = reference_sequences
+    _WORKER_STATE['encoded_references'] = _encode_sequences(reference_sequences) if NUMBA_AVAILABLE else None
+    _WORKER_STATE['reference_kmers'] = ([_kmer_set(ref_seq) for ref_seq in reference_sequences]
+                                        if min_kmer_overlap else None)
+    _WORKER_STATE['min_kmer_overlap'] = min_kmer_overlap
+
+
+def _worker_conservation_score(peptide: str) -> float:
+    """Score de conservação de um peptídeo com o estado do processo worker."""
+    return calculate_conservation_score(
+        peptide, _WORKER_STATE['reference_sequences'],
+        _WORKER_STATE['encoded_references'], _WORKER_STATE['reference_kmers'],
+        _WORKER_STATE['min_kmer_overlap']
+    )['conservation_score']
+
+
 def calculate_positional_conservation(peptides: List[str]) -> pd.DataFrame:
     """
     Calcula conservação posicional entre múltiplos peptídeos.
@@ -118,38 +325,54 @@ def calculate_positional_conservation(peptides: List[str]) -> pd.DataFrame:
     
     # Encontra tamanho máximo
     max_len = max(len(p) for p in peptides)
+    n_peptides = len(peptides)
+    
+    # Matriz (N, L) de bytes, com padding de gaps se necessário
+    aligned = ''.join(p.ljust(max_len, '-') for p in peptides).encode('ascii', errors='replace')
+    matrix = np.frombuffer(aligned, dtype=np.uint8).reshape(n_peptides, max_len)
+    col_idx = np.broadcast_to(np.arange(max_len), matrix.shape)
+    
+    # Contagens (128 símbolos ASCII, L posições) em uma única passada; gaps não contam
+    counts = np.bincount(
+        (matrix.astype(np.int64) * max_len + col_idx).ravel(),
+        minlength=128 * max_len
+    ).reshape(128, max_len)
+    counts[ord('-')] = 0
     
-    # Alinha sequências (padding com gaps se necessário)
-    aligned = []
-    for p in peptides:
-        aligned.append(p.ljust(max_len, '-'))
-    
-    # Calcula conservação por posição
-    positions = []
-    for pos in range(max_len):
-        column = [seq[pos] for seq in aligned if seq[pos] != '-']
-        if column:
-            entropy = calculate_shannon_entropy(column)
-            # Converte entropia para score de conservação (0-1)
-            # Entropia máxima para 20 AA = log2(20) ≈ 4.32
-            conservation = 1 - (entropy / 4.32) if entropy > 0 else 1.0
-            positions.append({
-                'position': pos + 1,
-                'entropy': round(entropy, 4),
-                'conservation': round(conservation, 4),
-                'most_common_aa': Counter(column).most_common(1)[0][0] if column else '-'
-            })
-    
-    return pd.DataFrame(positions)
-
-
-def add_conservation_to_dataframe(df: pd.DataFrame, reference_sequences: Optional[List[str]] = None) -> pd.DataFrame:
+    entropy = _entropy_from_counts(counts)
+    # Converte entropia para score de conservação (0-1)
+    # Entropia máxima para 20 AA = log2(20) ≈ 4.32
+    conservation = np.where(entropy > 0, 1 - entropy / 4.32, 1.0)
+    
+    # Resíduo mais comum; empates resolvidos pela primeira ocorrência (como Counter)
+    first_seen = np.full((128, max_len), n_peptides, dtype=np.int64)
+    np.minimum.at(first_seen, (matrix, col_idx), np.arange(n_peptides)[:, None])
+    is_top = counts == counts.max(axis=0)
+    most_common = np.where(is_top, first_seen, n_peptides).argmin(axis=0)
+    
+    # Apenas posições com pelo menos um resíduo
+    present = counts.sum(axis=0) > 0
+    
+    return pd.DataFrame({
+        'position': np.arange(1, max_len + 1)[present],
+        'entropy': np.round(entropy[present], 4),
+        'conservation': np.round(conservation[present], 4),
+        'most_common_aa': [chr(c) for c in most_common[present]]
+    })
+
+
+def add_conservation_to_dataframe(df: pd.DataFrame, reference_sequences: Optional[List[str]] = None,
+                                  n_jobs: Optional[int] = None,
+                                  min_kmer_overlap: Optional[float] = None) -> pd.DataFrame:
     """
     Adiciona scores de conservação ao DataFrame.
     
     Args:
         df: DataFrame com coluna 'peptide'
         reference_sequences: Sequências de referência (opcional)
+        n_jobs: Processos para o score de referência (None = número de CPUs, 1 = serial)
+        min_kmer_overlap: Pré-filtro aproximado por 3-meros (ver
+            calculate_conservation_score); None desativa
         
     Returns:
         DataFrame com colunas de conservação adicionadas
@@ -157,27 +380,49 @@ def add_conservation_to_dataframe(df: pd.DataFrame, reference_sequences: Optiona
     if 'peptide' not in df.columns:
         return df
     
-    df_result = df.copy()
+    # Monta apenas as colunas novas (evita copiar o DataFrame inteiro)
+    new_cols = {}
     
     # Conservação posicional entre peptídeos
-    peptides = df_result['peptide'].tolist()
+    peptides = df['peptide'].tolist()
     pos_conservation = calculate_positional_conservation(peptides)
     
     # Score médio de conservação posicional
     if not pos_conservation.empty:
         mean_conservation = pos_conservation['conservation'].mean()
-        df_result['positional_conservation'] = mean_conservation
+        new_cols['positional_conservation'] = mean_conservation
     else:
-        df_result['positional_conservation'] = 0.0
+        new_cols['positional_conservation'] = 0.0
     
     # Conservação em relação a sequências de referência (se fornecidas)
     if reference_sequences:
-        conservation_scores = []
-        for peptide in peptides:
-            scores = calculate_conservation_score(peptide, reference_sequences)
-            conservation_scores.append(scores['conservation_score'])
-        df_result['reference_conservation'] = conservation_scores
+        n_workers = min(n_jobs or os.cpu_count() or 1, len(peptides))
+        if n_workers > 1 and len(peptides) >= _MIN_PEPTIDES_PARALLEL:
+            # Peptídeos independentes: distribui em processos, referências via initializer
+            chunksize = max(1, len(peptides) // (4 * n_workers))
+            with ProcessPoolExecutor(max_workers=n_workers,
+                                     initializer=_init_conservation_worker,
+                                     initargs=(reference_sequences, min_kmer_overlap)) as executor:
+                conservation_scores = list(executor.map(_worker_conservation_score, peptides,
+                                                        chunksize=chunksize))
+        else:
+            # Referências codificadas uma única vez para todos os peptídeos
+            encoded_references = _encode_sequences(reference_sequences) if NUMBA_AVAILABLE else None
+            reference_kmers = ([_kmer_set(ref_seq) for ref_seq in reference_sequences]
+                               if min_kmer_overlap else None)
+            conservation_scores = []
+            for peptide in peptides:
+                scores = calculate_conservation_score(peptide, reference_sequences,
+                                                      encoded_references, reference_kmers,
+                                                      min_kmer_overlap)
+                conservation_scores.append(scores['conservation_score'])
+        new_cols['reference_conservation'] = conservation_scores
     else:
-        df_result['reference_conservation'] = 0.0
+        new_cols['reference_conservation'] = 0.0
+    
+    # Remove colunas que serão substituídas antes de concatenar
+    cols_to_remove = [c for c in new_cols if c in df.columns]
+    if cols_to_remove:
+        df = df.drop(columns=cols_to_remove)
     
-    return df_result
+    return pd.concat([df, pd.DataFrame(new_cols, index=df.index)], axis=1, copy=False)
@@ -10,7 +10,81 @@ import numpy as np
 from Bio import SeqIO
 from Bio.SeqUtils.ProtParam import ProteinAnalysis
 from typing import List, Dict, Optional, Union
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
 import io
+import os
+
+# Tenta importar PyArrow (opcional) para leitura/limpeza de TSV/CSV em buffers nativos
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.csv as pacsv
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+# Tenta importar Streamlit (opcional) para cache entre reexecuções do app
+try:
+    import streamlit as st
+    STREAMLIT_AVAILABLE = True
+    
+    def cached_data(func):
+        """Cache do Streamlit: reexecuções com as mesmas entradas viram consulta."""
+        return st.cache_data(show_spinner=False, max_entries=8)(func)
+except ImportError:
+    STREAMLIT_AVAILABLE = False
+    
+    def cached_data(func):
+        """Wrapper dummy quando Streamlit não está disponível."""
+        return func
+
+# Tenta importar xlsxwriter (opcional) para exportação Excel em modo streaming
+try:
+    import xlsxwriter
+    XLSXWRITER_AVAILABLE = True
+except ImportError:
+    XLSXWRITER_AVAILABLE = False
+
+
+def _flatten_peptides_arrow(source, sep: str) -> pd.DataFrame:
+    """
+    Lê tabela delimitada com PyArrow e lineariza as células em uma coluna 'peptide'.
+    
+    Equivalente a df.values.flatten() + strip + remoção de vazios, mas executado
+    sobre buffers de strings contíguos (sem um objeto Python por célula).
+    
+    Args:
+        source: Caminho ou buffer do arquivo
+        sep: Separador de colunas
+        
+    Returns:
+        DataFrame com coluna 'peptide'
+    """
+    table = pacsv.read_csv(
+        source,
+        read_options=pacsv.ReadOptions(autogenerate_column_names=True),
+        parse_options=pacsv.ParseOptions(delimiter=sep),
+    )
+    n_rows, n_cols = table.num_rows, table.num_columns
+    
+    flat = pa.concat_arrays([pc.cast(col, pa.string()).combine_chunks() for col in table.columns])
+    # Reordena de coluna-a-coluna para linha-a-linha (mesma ordem de values.flatten())
+    order = np.arange(n_rows * n_cols).reshape(n_cols, n_rows).T.ravel()
+    flat = pc.utf8_trim_whitespace(flat.take(pa.array(order)).drop_null())
+    flat = flat.filter(pc.not_equal(flat, ""))
+    
+    return pd.DataFrame({'peptide': flat.to_pandas(types_mapper=pd.ArrowDtype)})
+
+
+
+# Bytes que não são um dos 20 aminoácidos canônicos (removidos das sequências FASTA)
+_NON_AA_BYTES = bytes(b for b in range(256) if chr(b) not in "ACDEFGHIKLMNPQRSTVWY")
+
+
+def _clean_sequence(seq) -> str:
+    """Maiúsculas e apenas aminoácidos canônicos, via bytes.translate (sem regex)."""
+    return bytes(seq).upper().translate(None, _NON_AA_BYTES).decode('ascii')
 
 
 def read_fasta(filepath: str) -> pd.DataFrame:
@@ -28,9 +102,8 @@ def read_fasta(filepath: str) -> pd.DataFrame:
     try:
         with open(filepath, 'r') as handle:
             for record in SeqIO.parse(handle, "fasta"):
-                seq = str(record.seq).upper()
                 # Remove caracteres não-aminoácidos
-                seq = re.sub(r'[^ACDEFGHIKLMNPQRSTVWY]', '', seq)
+                seq = _clean_sequence(record.seq)
                 if seq:
                     peptides.append(seq)
     except Exception as e:
@@ -56,12 +129,18 @@ def read_tsv_csv(filepath: str, sep: Optional[str] = None) -> pd.DataFrame:
     """
     try:
         if filepath.endswith('.tsv'):
-            df = pd.read_csv(filepath, sep='\t', header=None)
+            sep = '\t'
         elif filepath.endswith('.csv'):
-            df = pd.read_csv(filepath, sep=sep if sep else ',', header=None)
-        else:
-            # Tenta detectar automaticamente
-            df = pd.read_csv(filepath, sep=sep, header=None)
+            sep = sep if sep else ','
+        
+        if PYARROW_AVAILABLE and sep is not None:
+            try:
+                return _flatten_peptides_arrow(filepath, sep)
+            except pa.ArrowInvalid:
+                pass  # Ex.: linhas com número variável de colunas; usa pandas
+        
+        # sep=None: pandas tenta detectar automaticamente
+        df = pd.read_csv(filepath, sep=sep, header=None)
         
         # Lineariza o DataFrame
         peptides_flat = df.values.flatten()
@@ -136,6 +215,39 @@ def load_peptides(filepath: str) -> pd.DataFrame:
         return read_tsv_csv(filepath)
 
 
+def write_excel(df: pd.DataFrame, filepath: str, chunk_size: int = 10_000):
+    """
+    Exporta DataFrame para Excel (.xlsx) sem índice.
+    
+    Com xlsxwriter, usa o modo constant_memory: as linhas são gravadas em
+    ordem e descarregadas no disco, então a memória não cresce com o tamanho
+    da planilha. Sem xlsxwriter, recorre a df.to_excel.
+    
+    Args:
+        df: DataFrame a exportar
+        filepath: Caminho do arquivo de saída
+        chunk_size: Linhas convertidas para valores Python por vez
+    """
+    if not XLSXWRITER_AVAILABLE:
+        df.to_excel(filepath, index=False)
+        return
+    
+    # constant_memory exige escrita linha a linha; por isso não passa pelo
+    # ExcelWriter do pandas, que grava célula a célula por coluna
+    with xlsxwriter.Workbook(filepath, {'constant_memory': True}) as workbook:
+        worksheet = workbook.add_worksheet()
+        header_format = workbook.add_format({'bold': True, 'border': 1, 'align': 'center'})
+        worksheet.write_row(0, 0, [str(col) for col in df.columns], header_format)
+        
+        for start in range(0, len(df), chunk_size):
+            block = df.iloc[start:start + chunk_size].astype(object)
+            block = block.where(block.notna(), None)  # NaN -> célula vazia
+            # xlsxwriter rejeita ±inf; grava como texto, igual ao inf_rep do df.to_excel
+            block = block.replace({np.inf: 'inf', -np.inf: '-inf'})
+            for offset, row in enumerate(block.itertuples(index=False, name=None)):
+                worksheet.write_row(start + offset + 1, 0, row)
+
+
 def read_fasta_from_bytes(file_bytes: bytes) -> pd.DataFrame:
     """
     Lê arquivo FASTA a partir de bytes (útil para Streamlit file_uploader).
@@ -153,8 +265,7 @@ def read_fasta_from_bytes(file_bytes: bytes) -> pd.DataFrame:
         file_io = io.StringIO(file_string)
         
         for record in SeqIO.parse(file_io, "fasta"):
-            seq = str(record.seq).upper()
-            seq = re.sub(r'[^ACDEFGHIKLMNPQRSTVWY]', '', seq)
+            seq = _clean_sequence(record.seq)
             if seq:
                 peptides.append(seq)
     except Exception as e:
@@ -179,8 +290,20 @@ def read_tsv_csv_from_bytes(file_bytes: bytes, filename: str, sep: Optional[str]
         DataFrame com coluna 'peptide'
     """
     try:
-        if filename.lower().endswith('.tsv') or (sep is None and '\t' in file_bytes.decode('utf-8', errors='ignore')[:1000]):
-            df = pd.read_csv(io.BytesIO(file_bytes), sep='\t', header=None)
+        # Detecta tabulação direto nos bytes (sem decodificar o arquivo)
+        has_tab = sep is None and b'\t' in file_bytes[:1000]
+        is_tsv = filename.lower().endswith('.tsv') or has_tab
+        
+        if PYARROW_AVAILABLE:
+            try:
+                return _flatten_peptides_arrow(io.BytesIO(file_bytes), '\t' if is_tsv else (sep if sep else ','))
+            except pa.ArrowInvalid:
+                pass  # Ex.: linhas com número variável de colunas; usa pandas
+        
+        if is_tsv:
+            # TSV sem aspas: dtype=str pula a inferência de tipos e na_filter=False a busca por NA
+            df = pd.read_csv(io.BytesIO(file_bytes), sep='\t', header=None,
+                             engine='c', dtype=str, na_filter=False)
         else:
             df = pd.read_csv(io.BytesIO(file_bytes), sep=sep if sep else ',', header=None)
         
@@ -228,10 +351,13 @@ def read_excel_from_bytes(file_bytes: bytes, sheet_name: Optional[Union[str, int
         raise ValueError(f"Erro ao ler arquivo Excel: {e}")
 
 
+@cached_data
 def load_peptides_from_bytes(file_bytes: bytes, filename: str) -> pd.DataFrame:
     """
     Carrega peptídeos a partir de bytes (para uso com Streamlit file_uploader).
     
+    Com Streamlit, o resultado fica em cache por (conteúdo, nome do arquivo).
+    
     Args:
         file_bytes: Conteúdo do arquivo em bytes
         filename: Nome do arquivo (para detectar formato)
@@ -269,24 +395,23 @@ def validate_peptides(df: pd.DataFrame, min_length: int = 8, max_length: int = 1
     if 'peptide' not in df.columns:
         raise ValueError("DataFrame deve conter coluna 'peptide'")
     
-    df = df.copy()
-    
-    # Padroniza para maiúsculas
-    df['peptide'] = df['peptide'].astype(str).str.upper().str.strip()
+    # Padroniza para maiúsculas (sem copiar o DataFrame inteiro)
+    peptide_clean = df['peptide'].astype(str).str.upper().str.strip()
     
     # Regex para aminoácidos canônicos
     aa_regex = re.compile("^[ACDEFGHIKLMNPQRSTVWY]+$")
     
     # Valida sequências
-    df["valid"] = df['peptide'].apply(lambda x: bool(aa_regex.match(x)))
-    
-    # Remove inválidos e duplicatas
-    df_valid = df[df["valid"]].drop(columns=["valid"]).drop_duplicates(subset=['peptide']).copy()
+    valid = peptide_clean.apply(lambda x: bool(aa_regex.match(x)))
     
-    # Filtro de tamanho (MHC-I liga em 8-14 meros)
-    df_valid = df_valid[df_valid['peptide'].str.len().between(min_length, max_length)]
+    # Remove inválidos e duplicatas + filtro de tamanho (MHC-I liga em 8-14 meros)
+    mask = (
+        valid
+        & ~peptide_clean.duplicated()
+        & peptide_clean.str.len().between(min_length, max_length)
+    )
     
-    return df_valid.reset_index(drop=True)
+    return df.loc[mask].assign(peptide=peptide_clean[mask]).reset_index(drop=True)
 
 
 def calculate_kyte_doolittle_hydrophobicity(peptide: str) -> float:
@@ -373,10 +498,61 @@ def calculate_physchem_properties(peptide: str) -> Dict[str, float]:
         }
 
 
+# Abaixo deste número de peptídeos únicos o cálculo é feito sem thread pool
+_MIN_PEPTIDES_THREADED = 2048
+
+
+# Ordem fixa das colunas retornadas por _cached_physchem
+PHYSCHEM_COLUMNS = (
+    "length", "mw", "pI", "gravy",
+    "kd_hydrophobicity", "instability_index", "aliphatic_index"
+)
+
+
+@lru_cache(maxsize=None)
+def _cached_physchem(peptide: str) -> tuple:
+    """
+    Versão memoizada de calculate_physchem_properties.
+    
+    Args:
+        peptide: Sequência do peptídeo
+        
+    Returns:
+        Tupla de propriedades na ordem de PHYSCHEM_COLUMNS
+    """
+    properties = calculate_physchem_properties(peptide)
+    return tuple(properties[col] for col in PHYSCHEM_COLUMNS)
+
+
+@cached_data
+def _physchem_table(peptides: tuple) -> pd.DataFrame:
+    """
+    Tabela de propriedades indexada por peptídeo.
+    
+    Com Streamlit, fica em cache pelo conjunto (ordenado) de peptídeos únicos.
+    
+    Args:
+        peptides: Tupla de peptídeos únicos
+        
+    Returns:
+        DataFrame com colunas PHYSCHEM_COLUMNS
+    """
+    if len(peptides) >= _MIN_PEPTIDES_THREADED and (os.cpu_count() or 1) > 1:
+        # Threads evitam o pickling de processos; lru_cache é seguro entre threads
+        with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+            rows = list(executor.map(_cached_physchem, peptides))
+    else:
+        rows = [_cached_physchem(pep) for pep in peptides]
+    return pd.DataFrame(rows, columns=list(PHYSCHEM_COLUMNS), index=list(peptides))
+
+
 def add_physchem_properties(df: pd.DataFrame) -> pd.DataFrame:
     """
     Adiciona propriedades físico-químicas ao DataFrame de peptídeos.
     
+    Propriedades são calculadas uma vez por sequência única e replicadas
+    para linhas com peptídeos repetidos.
+    
     Args:
         df: DataFrame com coluna 'peptide'
         
@@ -386,15 +562,29 @@ def add_physchem_properties(df: pd.DataFrame) -> pd.DataFrame:
     if 'peptide' not in df.columns:
         raise ValueError("DataFrame deve conter coluna 'peptide'")
     
-    # Calcula propriedades para cada peptídeo
-    props = df['peptide'].apply(calculate_physchem_properties).apply(pd.Series)
+    # Calcula propriedades apenas para peptídeos únicos
+    props = _physchem_table(tuple(sorted(df['peptide'].unique())))
     
-    # Remove colunas duplicadas antes de concatenar
+    # Remove colunas duplicadas antes de juntar
     cols_to_remove = [c for c in props.columns if c in df.columns]
     if cols_to_remove:
         df = df.drop(columns=cols_to_remove)
     
-    # Concatena propriedades
-    df_result = pd.concat([df.reset_index(drop=True), props.reset_index(drop=True)], axis=1)
+    # Junta propriedades por sequência
+    df_result = df.reset_index(drop=True).join(props, on='peptide')
     
     return df_result
+
+
+def min_max_normalize(col: pd.Series) -> np.ndarray:
+    """
+    Normalização min-max em [0, 1] (NaN conta como 0), em float32.
+    
+    Coluna constante vira 0 (como o MinMaxScaler); coluna vazia retorna 0.5.
+    Usada por mhc_predictions e pept_refactored em calculate_final_scores.
+    """
+    v = np.nan_to_num(col.to_numpy(dtype=np.float32), nan=0.0)
+    if not v.size:
+        return 0.5
+    lo, hi = v.min(), v.max()
+    return (v - lo) / (hi - lo) if hi > lo else np.zeros_like(v)
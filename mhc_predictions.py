@@ -6,10 +6,12 @@ Integra MHCflurry, NetMHCpan e outras ferramentas.
 
 import pandas as pd
 import numpy as np
-from typing import List, Optional
+from typing import Dict, List, Optional, Tuple
 import warnings
 warnings.filterwarnings('ignore')
 
+from data_handler import min_max_normalize
+
 # Tenta importar MHCflurry
 try:
     from mhcflurry import Class1PresentationPredictor, Class2PresentationPredictor
@@ -19,6 +21,80 @@ except ImportError:
     print("⚠️ MHCflurry não disponível. Instale com: pip install mhcflurry")
 
 
+# Colunas mantidas ao juntar as predições por alelo no formato longo
+_LONG_FORMAT_COLUMNS = ('peptide', 'peptide_num', 'affinity', 'presentation_score',
+                        'presentation_percentile')
+
+
+def _predict_alleles(predictor, peptides, alleles: List[str]) -> pd.DataFrame:
+    """
+    Prediz todos os alelos em uma única chamada de predict.
+    
+    Cada alelo vira uma "amostra" própria (uma lista de alelos seria tratada
+    como um único genótipo, com só o melhor alelo no resultado). Se o preditor
+    rejeitar alelos em dicionário, faz uma chamada por alelo e junta apenas as
+    colunas usadas na seleção do melhor alelo, via np.concatenate.
+    
+    Returns:
+        DataFrame com uma linha por (peptídeo, alelo) e o alelo em 'sample_name'
+    """
+    try:
+        return predictor.predict(
+            peptides=peptides,
+            alleles={allele: [allele] for allele in alleles},
+            include_affinity_percentile=True,
+            verbose=0
+        )
+    except (TypeError, ValueError):
+        preds = []
+        for allele in alleles:
+            results = predictor.predict(
+                peptides=peptides,
+                alleles=[allele],
+                include_affinity_percentile=True,
+                verbose=0
+            )
+            preds.append(results)
+        
+        # Formato longo montado direto dos arrays (sem alinhamento de índices do concat)
+        cols = [c for c in _LONG_FORMAT_COLUMNS if all(c in r.columns for r in preds)]
+        data = {c: np.concatenate([r[c].to_numpy() for r in preds]) for c in cols}
+        data['sample_name'] = np.repeat(alleles, [len(r) for r in preds])
+        return pd.DataFrame(data)
+
+
+def _best_allele(results: pd.DataFrame, alleles: List[str], n_peptides: int,
+                 columns: List[str]) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+    """
+    Seleciona o melhor alelo (maior presentation_score) de cada peptídeo.
+    
+    Espalha as colunas pedidas em matrizes (n_peptídeos, n_alelos) pelas
+    posições (peptide_num, alelo) e faz um único argmax por linha; empates
+    ficam com o primeiro alelo de ``alleles``.
+    
+    Returns:
+        Tupla (índice do melhor alelo por peptídeo, valores de cada coluna no melhor alelo)
+    """
+    allele_pos = pd.Categorical(results['sample_name'], categories=alleles).codes
+    if 'peptide_num' in results.columns:
+        pep_pos = results['peptide_num'].to_numpy()
+    else:
+        pep_pos = results.groupby('sample_name', sort=False).cumcount().to_numpy()
+    
+    def _matrix(col: str) -> np.ndarray:
+        mat = np.full((n_peptides, len(alleles)), np.nan)
+        mat[pep_pos, allele_pos] = results[col].to_numpy()
+        return mat
+    
+    score_mat = _matrix('presentation_score')
+    best_idx = score_mat.argmax(axis=1)
+    rows = np.arange(n_peptides)
+    return best_idx, {
+        col: (score_mat if col == 'presentation_score' else _matrix(col))[rows, best_idx]
+        for col in columns
+    }
+
+
 def run_mhcflurry_class1_predictions(df: pd.DataFrame, alleles: List[str]) -> pd.DataFrame:
     """
     Executa predições MHC-I usando MHCflurry.
@@ -37,40 +113,30 @@ def run_mhcflurry_class1_predictions(df: pd.DataFrame, alleles: List[str]) -> pd
     try:
         predictor = Class1PresentationPredictor.load()
         
-        preds = []
-        for allele in alleles:
-            results = predictor.predict(
-                peptides=df['peptide'].values,
-                alleles=[allele],
-                include_affinity_percentile=True,
-                verbose=0
-            )
-            results['allele'] = allele
-            preds.append(results)
-        
-        # Combina e pega melhor alelo
-        full_preds = pd.concat(preds)
-        best_preds = full_preds.loc[full_preds.groupby('peptide')['presentation_score'].idxmax()]
-        
-        # Merge
-        df_result = pd.merge(
-            df,
-            best_preds[['peptide', 'affinity', 'presentation_score', 'allele']],
-            on='peptide',
-            how='left'
+        # Prediz apenas peptídeos únicos; codes replica o resultado para as repetições
+        codes, unique_peps = pd.factorize(df['peptide'], use_na_sentinel=False)
+        results = _predict_alleles(predictor, unique_peps, alleles)
+        has_percentile = 'presentation_percentile' in results.columns
+        
+        # Melhor alelo por peptídeo: um argmax na matriz (n_peptídeos, n_alelos)
+        columns = ['presentation_score', 'affinity']
+        if has_percentile:
+            columns.append('presentation_percentile')
+        best_idx, best = _best_allele(results, alleles, len(unique_peps), columns)
+        
+        df_result = df.assign(
+            affinity=best['affinity'][codes],
+            presentation_score=best['presentation_score'][codes],
+            allele=np.asarray(alleles)[best_idx[codes]]
         )
         
         # Renomeia
-        if 'affinity' in df_result.columns:
-            df_result['affinity_nm'] = df_result['affinity']
-        if 'presentation_score' in df_result.columns:
-            df_result['mhc_score'] = df_result['presentation_score']
+        df_result['affinity_nm'] = df_result['affinity']
+        df_result['mhc_score'] = df_result['presentation_score']
         
         # Percentile rank
-        if 'presentation_percentile' in best_preds.columns:
-            df_result['percentile_rank'] = df_result['peptide'].map(
-                best_preds.set_index('peptide')['presentation_percentile']
-            )
+        if has_percentile:
+            df_result['percentile_rank'] = best['presentation_percentile'][codes]
         else:
             df_result['percentile_rank'] = df_result['mhc_score'].rank(pct=True, ascending=False)
         
@@ -99,37 +165,19 @@ def run_mhcflurry_class2_predictions(df: pd.DataFrame, alleles: List[str]) -> pd
     try:
         predictor = Class2PresentationPredictor.load()
         
-        preds = []
-        for allele in alleles:
-            results = predictor.predict(
-                peptides=df['peptide'].values,
-                alleles=[allele],
-                include_affinity_percentile=True,
-                verbose=0
-            )
-            results['allele'] = allele
-            preds.append(results)
+        # Prediz apenas peptídeos únicos; codes replica o resultado para as repetições
+        codes, unique_peps = pd.factorize(df['peptide'], use_na_sentinel=False)
+        results = _predict_alleles(predictor, unique_peps, alleles)
         
-        # Combina e pega melhor alelo
-        full_preds = pd.concat(preds)
-        best_preds = full_preds.loc[full_preds.groupby('peptide')['presentation_score'].idxmax()]
-        
-        # Merge
-        df_result = pd.merge(
-            df,
-            best_preds[['peptide', 'affinity', 'presentation_score', 'allele']],
-            on='peptide',
-            how='left',
-            suffixes=('', '_mhcii')
-        )
+        # Melhor alelo por peptídeo via argmax na matriz (n_peptídeos, n_alelos)
+        best_idx, best = _best_allele(results, alleles, len(unique_peps), ['presentation_score', 'affinity'])
         
-        # Renomeia para MHC-II
-        if 'affinity' in df_result.columns:
-            df_result['affinity_mhcii_nm'] = df_result['affinity']
-        if 'presentation_score' in df_result.columns:
-            df_result['mhcii_score'] = df_result['presentation_score']
-        if 'allele' in df_result.columns:
-            df_result['allele_mhcii'] = df_result['allele']
+        # Atribui direto com nomes MHC-II (não sobrescreve colunas MHC-I)
+        df_result = df.assign(
+            affinity_mhcii_nm=best['affinity'][codes],
+            mhcii_score=best['presentation_score'][codes],
+            allele_mhcii=np.asarray(alleles)[best_idx[codes]]
+        )
         
         return df_result
         
@@ -146,28 +194,21 @@ def calculate_final_scores(df: pd.DataFrame) -> pd.DataFrame:
         df: DataFrame com predições
         
     Returns:
-        DataFrame com scores finais calculados
+        DataFrame com scores finais calculados (o DataFrame de entrada não é alterado)
     """
-    df = df.copy()
-    
-    from sklearn.preprocessing import MinMaxScaler
-    scaler = MinMaxScaler()
+    # Cópia rasa: as colunas novas não aparecem no DataFrame do chamador e os
+    # dados existentes não são duplicados (a ordenação no fim já gera um novo frame)
+    df = df.copy(deep=False)
     
     # Normaliza score MHC-I
     if 'mhc_score' in df.columns:
-        try:
-            df['norm_mhc'] = scaler.fit_transform(df[['mhc_score']].fillna(0))
-        except:
-            df['norm_mhc'] = 0.5
+        df['norm_mhc'] = min_max_normalize(df['mhc_score'])
     else:
         df['norm_mhc'] = 0.0
     
     # Normaliza score MHC-II (se disponível)
     if 'mhcii_score' in df.columns:
-        try:
-            df['norm_mhcii'] = scaler.fit_transform(df[['mhcii_score']].fillna(0))
-        except:
-            df['norm_mhcii'] = 0.5
+        df['norm_mhcii'] = min_max_normalize(df['mhcii_score'])
     else:
         df['norm_mhcii'] = 0.0
     
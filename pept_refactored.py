@@ -12,17 +12,23 @@ Autor: Engenheiro de Bioinformática Sênior
 Data: 2026-01-30
 """
 
+import gc
 import sys
 import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from pathlib import Path
+from typing import Optional
 
 # Importa módulos locais
 from data_handler import (
     load_peptides, 
     validate_peptides, 
-    add_physchem_properties
+    add_physchem_properties,
+    write_excel,
+    min_max_normalize
 )
-from api_client import APIClientManager
+from api_client import APIClientManager, RateLimiter
 from report_gen import generate_report
 
 # Imports para pipeline MHCflurry (mantido para compatibilidade)
@@ -30,87 +36,177 @@ import pandas as pd
 import numpy as np
 from mhcflurry import Class1PresentationPredictor
 
+# Colunas vindas das redes float32 do MHCflurry (podem ser reduzidas para float32)
+MHCFLURRY_SCORE_COLUMNS = ('affinity_nm', 'mhc_score')
 
-def run_mhcflurry_predictions(df: pd.DataFrame, alleles: list) -> pd.DataFrame:
+
+@lru_cache(maxsize=1)
+def _get_predictor():
+    """
+    Carrega o preditor MHCflurry uma única vez por processo.
+    
+    O objeto em cache é compartilhado; as chamadas de predict são apenas
+    leitura, mas não devem ser feitas de várias threads ao mesmo tempo
+    sem sincronização externa.
+    """
+    return Class1PresentationPredictor.load()
+
+
+def detect_device() -> str:
+    """
+    Escolhe o dispositivo PyTorch disponível: 'cuda', 'mps' ou 'cpu'.
+    
+    Returns:
+        'cpu' se o PyTorch não estiver instalado
+    """
+    try:
+        import torch
+    except ImportError:
+        return 'cpu'
+    
+    if torch.cuda.is_available():
+        return 'cuda'
+    mps = getattr(torch.backends, 'mps', None)
+    if mps is not None and mps.is_available():
+        return 'mps'
+    return 'cpu'
+
+
+def _configure_device(device: str):
+    """Ajusta o ambiente do backend PyTorch do MHCflurry (>= 2.2) para o dispositivo."""
+    if device == 'cpu':
+        os.environ['CUDA_VISIBLE_DEVICES'] = ''
+    elif device == 'mps':
+        # Operações sem kernel MPS caem para a CPU em vez de falhar
+        os.environ.setdefault('PYTORCH_ENABLE_MPS_FALLBACK', '1')
+    elif device.startswith('cuda:'):
+        os.environ['CUDA_VISIBLE_DEVICES'] = device.split(':', 1)[1]
+
+
+def _pred_one(predictor, peptides, allele: str) -> pd.DataFrame:
+    """Prediz um único alelo e marca as linhas com ele em 'sample_name'."""
+    preds = predictor.predict(
+        peptides=peptides,
+        alleles=[allele],
+        include_affinity_percentile=True,
+        verbose=0
+    )
+    preds['sample_name'] = allele
+    return preds
+
+
+def _predict_alleles(predictor, peptides, alleles: list) -> pd.DataFrame:
+    """
+    Prediz todos os alelos para um lote de peptídeos.
+    
+    Caminho preferido: uma chamada de predict com cada alelo como "amostra"
+    própria. Se o preditor rejeitar alelos em dicionário (versões antigas do
+    MHCflurry), faz uma chamada por alelo em paralelo; o backend libera o GIL
+    durante a inferência, então as threads se sobrepõem.
+    
+    Returns:
+        DataFrame com uma linha por (peptídeo, alelo) e o alelo em 'sample_name'
+    """
+    try:
+        return predictor.predict(
+            peptides=peptides,
+            alleles={allele: [allele] for allele in alleles},
+            include_affinity_percentile=True,
+            verbose=0
+        )
+    except (TypeError, ValueError):
+        with ThreadPoolExecutor(max_workers=min(len(alleles), 4)) as executor:
+            preds = list(executor.map(lambda allele: _pred_one(predictor, peptides, allele), alleles))
+        return pd.concat(preds, ignore_index=True, copy=False)
+
+
+def run_mhcflurry_predictions(df: pd.DataFrame, alleles: list,
+                              device: Optional[str] = None,
+                              batch_size: int = 10_000) -> pd.DataFrame:
     """
     Executa predições usando MHCflurry (local, não requer API).
     
     Args:
         df: DataFrame com coluna 'peptide'
         alleles: Lista de alelos HLA (ex: ['HLA-A*02:01'])
+        device: Dispositivo para inferência ('cuda', 'cuda:N', 'mps' ou 'cpu').
+            None mantém a detecção automática do MHCflurry. Deve ser definido
+            antes da primeira carga do modelo no processo.
+        batch_size: Número de peptídeos únicos por chamada de predict; limita
+            o pico de memória em entradas grandes
         
     Returns:
         DataFrame enriquecido com predições MHCflurry
     """
     print(f"Rodando predição MHCflurry para {alleles}...")
     
-    predictor = Class1PresentationPredictor.load()
-    
-    # Predição para todos os alelos
-    preds = []
-    for allele in alleles:
-        results = predictor.predict(
-            peptides=df['peptide'].values,
-            alleles=[allele],
-            include_affinity_percentile=True,
-            verbose=0
-        )
-        results['allele'] = allele
-        preds.append(results)
-    
-    # Combina resultados e pega o melhor alelo para cada peptídeo
-    full_preds = pd.concat(preds)
-    best_preds = full_preds.loc[full_preds.groupby('peptide')['presentation_score'].idxmax()]
-    
-    # Merge com DataFrame original
-    df_result = pd.merge(
-        df, 
-        best_preds[['peptide', 'affinity', 'presentation_score', 'allele']], 
-        on='peptide', 
-        how='left'
-    )
-    
-    # Renomeia colunas para consistência
-    if 'affinity' in df_result.columns:
-        df_result['affinity_nm'] = df_result['affinity']
-    
-    if 'presentation_score' in df_result.columns:
-        df_result['mhc_score'] = df_result['presentation_score']
-    
-    # Calcula percentile rank se disponível
-    if 'presentation_percentile' in best_preds.columns:
-        df_result['percentile_rank'] = df_result['peptide'].map(
-            best_preds.set_index('peptide')['presentation_percentile']
-        )
-    else:
+    if device:
+        _configure_device(device)
+    
+    predictor = _get_predictor()
+    if device and hasattr(predictor, 'to'):
+        predictor.to(device)
+    
+    # Prediz apenas peptídeos únicos (o merge abaixo replica para as repetições)
+    unique_peps = pd.unique(df['peptide'].values)
+    
+    # Predição para todos os alelos de uma vez, em lotes de peptídeos: cada
+    # alelo vira uma "amostra" própria, então o resultado tem uma linha por
+    # (peptídeo, alelo)
+    chunks = [
+        _predict_alleles(predictor, unique_peps[i:i + batch_size], alleles)
+        for i in range(0, len(unique_peps), batch_size)
+    ]
+    full_preds = pd.concat(chunks, ignore_index=True, copy=False)
+    
+    # Pega o melhor alelo para cada peptídeo: ordena por score decrescente
+    # dentro de cada peptídeo e fica com a primeira linha (empates resolvidos
+    # pela ordem original, como no idxmax)
+    best_preds = full_preds.sort_values(
+        ['peptide', 'presentation_score'], ascending=[True, False], kind='stable'
+    ).drop_duplicates('peptide', keep='first')
+    
+    # Um único rename no frame pequeno (um peptídeo por linha)
+    best_preds = best_preds.rename(columns={
+        'sample_name': 'allele',
+        'affinity': 'affinity_nm',
+        'presentation_score': 'mhc_score',
+        'presentation_percentile': 'percentile_rank',
+    })
+    
+    # Merge com DataFrame original (percentile entra no mesmo join, se disponível)
+    merge_cols = ['peptide', 'affinity_nm', 'mhc_score', 'allele']
+    if 'percentile_rank' in best_preds.columns:
+        merge_cols.append('percentile_rank')
+    df_result = pd.merge(df, best_preds[merge_cols], on='peptide', how='left')
+    
+    if 'percentile_rank' not in df_result.columns:
         # Calcula rank relativo
         df_result['percentile_rank'] = df_result['mhc_score'].rank(pct=True, ascending=False)
     
     return df_result
 
 
-def calculate_final_scores(df: pd.DataFrame) -> pd.DataFrame:
+def calculate_final_scores(df: pd.DataFrame, inplace: bool = True) -> pd.DataFrame:
     """
     Calcula scores finais normalizados para ranking.
     
     Args:
         df: DataFrame com predições
+        inplace: Se True (padrão), adiciona as colunas de score diretamente
+            em ``df``. Se False, trabalha sobre uma cópia rasa, sem alterar
+            o DataFrame de entrada.
         
     Returns:
-        DataFrame com scores finais calculados
+        DataFrame com scores finais calculados, ordenado por
+        'final_rank_score' (sempre um novo objeto, por causa da ordenação)
     """
-    df = df.copy()
+    if not inplace:
+        df = df.copy(deep=False)
     
-    # Normaliza scores
-    from sklearn.preprocessing import MinMaxScaler
-    scaler = MinMaxScaler()
-    
-    # Normaliza score de apresentação MHC
+    # Normaliza score de apresentação MHC (min-max em [0, 1])
     if 'mhc_score' in df.columns:
-        try:
-            df['norm_mhc'] = scaler.fit_transform(df[['mhc_score']].fillna(0))
-        except:
-            df['norm_mhc'] = 0.5
+        df['norm_mhc'] = min_max_normalize(df['mhc_score'])
     
     # Score final (pode ser ajustado conforme necessidade)
     if 'norm_mhc' in df.columns:
@@ -153,6 +249,11 @@ def main():
     # Configurações de API
     USE_API_ENRICHMENT = True  # Se False, usa apenas MHCflurry local
     MAX_WORKERS = 5  # Número de threads para processamento paralelo
+    API_CALLS_PER_SECOND = 5  # Limite de requisições às APIs (token bucket)
+    API_MAX_RETRIES = 3  # Tentativas extras com backoff em 429/5xx
+    
+    # Dispositivo para inferência MHCflurry (GPU/MPS quando disponível)
+    DEVICE = detect_device()
     
     # ========================================================================
     # ETAPA 1: CARREGAMENTO E VALIDAÇÃO DE DADOS
@@ -172,6 +273,7 @@ def main():
         valid_count = len(df_valid)
         print(f"✓ {valid_count} peptídeos válidos após validação")
         print(f"  Taxa de validação: {(valid_count/total_peptides*100):.1f}%")
+        del df_input  # Só a contagem é usada daqui em diante
         
         if df_valid.empty:
             print("❌ Nenhum peptídeo válido encontrado após validação.")
@@ -191,6 +293,9 @@ def main():
     try:
         df_result = add_physchem_properties(df_valid)
         print(f"✓ Propriedades calculadas para {len(df_result)} peptídeos")
+        # Libera os quadros intermediários antes das etapas mais pesadas
+        del df_valid
+        gc.collect()
     except Exception as e:
         print(f"❌ Erro ao calcular propriedades: {e}")
         return
@@ -203,8 +308,8 @@ def main():
     print("-" * 70)
     
     try:
-        df_result = run_mhcflurry_predictions(df_result, ALLELES)
-        print(f"✓ Predições MHCflurry concluídas")
+        df_result = run_mhcflurry_predictions(df_result, ALLELES, device=DEVICE)
+        print(f"✓ Predições MHCflurry concluídas ({DEVICE})")
         
         if 'affinity_nm' in df_result.columns:
             best_affinity = df_result['affinity_nm'].min()
@@ -225,7 +330,11 @@ def main():
         print("⚠️  Nota: Esta etapa pode demorar devido a rate limiting das APIs")
         
         try:
-            api_manager = APIClientManager(max_workers=MAX_WORKERS, request_delay=0.2)
+            api_manager = APIClientManager(
+                max_workers=MAX_WORKERS,
+                rate_limiter=RateLimiter(API_CALLS_PER_SECOND, per=1.0),
+                max_retries=API_MAX_RETRIES
+            )
             df_result = api_manager.enrich_dataframe(
                 df_result, 
                 allele=ALLELES[0],
@@ -246,6 +355,12 @@ def main():
     try:
         df_result = calculate_final_scores(df_result)
         print(f"✓ Scores finais calculados")
+        
+        # Scores do MHCflurry vêm de redes float32: reduz só essas colunas antes da
+        # exportação (propriedades físico-químicas e percentile_rank ficam em float64)
+        float_cols = [col for col in MHCFLURRY_SCORE_COLUMNS
+                      if col in df_result.columns and df_result[col].dtype == 'float64']
+        df_result = df_result.astype({col: 'float32' for col in float_cols})
     except Exception as e:
         print(f"❌ Erro ao calcular scores finais: {e}")
         return
@@ -264,7 +379,7 @@ def main():
     # Exporta para Excel
     excel_output = f"{output_base}_RESULTADO.xlsx"
     try:
-        df_result.to_excel(excel_output, index=False)
+        write_excel(df_result, excel_output)
         print(f"✓ Dados exportados para Excel: {excel_output}")
     except Exception as e:
         print(f"⚠️  Erro ao exportar Excel: {e}")
@@ -6,6 +6,8 @@ Usa fpdf2 para criar relatórios profissionais com resumo e tabelas de afinidade
 
 from fpdf import FPDF
 from typing import List, Dict, Optional
+import numbers
+import numpy as np
 import pandas as pd
 from datetime import datetime
 import os
@@ -13,12 +15,77 @@ import tempfile
 import matplotlib
 matplotlib.use('Agg')  # Backend não-interativo
 import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
 import plotly.graph_objects as go
 import plotly.express as px
 from PIL import Image
 import io
 
 
+# Tradução dos nomes de colunas para o cabeçalho da tabela
+HEADER_PT = {
+    'peptide': 'Peptideo',
+    'affinity_nm': 'Afinidade (nM)',
+    'iedb_affinity_nm': 'Afinidade IEDB (nM)',
+    'mhc_score': 'Score MHC',
+    'presentation_score': 'Score Apresentacao',
+    'iedb_immunogenicity': 'Imunogenicidade',
+    'percentile_rank': 'Rank %',
+    'final_rank_score': 'Score Final'
+}
+
+
+# Templates da seção de estatísticas (preenchidos com min/max/mean/median/std)
+_STATS_TEMPLATES = {
+    'affinity': (
+        "Afinidade (nM):\n"
+        "  - Minima: {min:.2f}\n"
+        "  - Maxima: {max:.2f}\n"
+        "  - Media: {mean:.2f}\n"
+        "  - Mediana: {median:.2f}\n"
+        "  - Desvio Padrao: {std:.2f}"
+    ),
+    'length': (
+        "Tamanho dos peptideos:\n"
+        "  - Minimo: {min:.0f} residuos\n"
+        "  - Maximo: {max:.0f} residuos\n"
+        "  - Media: {mean:.1f} residuos"
+    ),
+    'gravy': (
+        "Indice GRAVY:\n"
+        "  - Minimo: {min:.3f}\n"
+        "  - Maximo: {max:.3f}\n"
+        "  - Media: {mean:.3f}"
+    ),
+}
+
+
+def _select_col_widths(n_headers: int) -> List[int]:
+    """Larguras das colunas da tabela conforme o número de colunas."""
+    if n_headers <= 3:
+        col_widths = [60, 50, 50]
+    elif n_headers == 4:
+        col_widths = [50, 40, 40, 40]
+    elif n_headers == 5:
+        col_widths = [45, 35, 35, 35, 30]
+    else:
+        col_widths = [40, 30, 30, 30, 25, 25]
+    return col_widths[:n_headers]
+
+
+def _format_table_value(value, col: str) -> str:
+    """Formata um valor de célula da tabela de afinidade."""
+    if pd.isna(value):
+        return '-'
+    if isinstance(value, numbers.Real):  # inclui escalares NumPy (float32, int64)
+        if 'affinity' in col.lower():
+            return f"{value:.2f}"
+        if 'score' in col.lower() or 'rank' in col.lower():
+            return f"{value:.3f}"
+        return f"{value:.2f}"
+    return str(value)[:15]  # Limita tamanho
+
+
 class PeptideReportPDF(FPDF):
     """Classe customizada para geração de relatórios de peptídeos."""
     
@@ -128,42 +195,18 @@ Critérios de validação aplicados:
         self.set_fill_color(44, 62, 80)
         self.set_text_color(255, 255, 255)
         
-        col_widths = [50, 30, 30, 30, 25, 25]  # Ajustar conforme necessário
         headers = list(df_display.columns)
-        
-        # Ajusta larguras conforme número de colunas
-        if len(headers) <= 3:
-            col_widths = [60, 50, 50]
-        elif len(headers) == 4:
-            col_widths = [50, 40, 40, 40]
-        elif len(headers) == 5:
-            col_widths = [45, 35, 35, 35, 30]
-        else:
-            col_widths = [40, 30, 30, 30, 25, 25]
-        
-        col_widths = col_widths[:len(headers)]
+        col_widths = _select_col_widths(len(headers))
         total_width = sum(col_widths)
         
         # Desenha cabeçalho
         x_start = (210 - total_width) / 2  # Centraliza tabela
-        x = x_start
+        self.set_x(x_start)
         
         for i, header in enumerate(headers):
-            # Traduz nomes de colunas para português
-            header_pt = {
-                'peptide': 'Peptideo',
-                'affinity_nm': 'Afinidade (nM)',
-                'iedb_affinity_nm': 'Afinidade IEDB (nM)',
-                'mhc_score': 'Score MHC',
-                'presentation_score': 'Score Apresentacao',
-                'iedb_immunogenicity': 'Imunogenicidade',
-                'percentile_rank': 'Rank %',
-                'final_rank_score': 'Score Final'
-            }.get(header, header)
-            
-            self.set_xy(x, self.get_y())
+            header_pt = HEADER_PT.get(header, header)
+            # cell() com ln=0 avança o cursor para a próxima coluna
             self.cell(col_widths[i], 7, header_pt[:20], 1, 0, 'C', True)  # Limita tamanho do texto
-            x += col_widths[i]
         
         self.ln(7)
         
@@ -172,54 +215,32 @@ Critérios de validação aplicados:
         self.set_text_color(0, 0, 0)
         self.set_fill_color(245, 245, 245)
         
+        # Formata os valores coluna a coluna antes de desenhar
+        cell_texts = [
+            [_format_table_value(value, col) for value in df_display[col].to_numpy()]
+            for col in headers
+        ]
+        n_rows = len(df_display)
+        
         fill = False
-        for idx, row in df_display.iterrows():
+        for row_idx in range(n_rows):
             if self.get_y() > 270:  # Nova página se necessário
                 self.add_page()
                 # Redesenha cabeçalho
-                x = x_start
                 self.set_font('Helvetica', 'B', 9)
                 self.set_fill_color(44, 62, 80)
                 self.set_text_color(255, 255, 255)
+                self.set_x(x_start)
                 for i, header in enumerate(headers):
-                    header_pt = {
-                        'peptide': 'Peptideo',
-                        'affinity_nm': 'Afinidade (nM)',
-                        'iedb_affinity_nm': 'Afinidade IEDB (nM)',
-                        'mhc_score': 'Score MHC',
-                        'presentation_score': 'Score Apresentacao',
-                        'iedb_immunogenicity': 'Imunogenicidade',
-                        'percentile_rank': 'Rank %',
-                        'final_rank_score': 'Score Final'
-                    }.get(header, header)
-                    self.set_xy(x, self.get_y())
-                    self.cell(col_widths[i], 7, header_pt[:20], 1, 0, 'C', True)
-                    x += col_widths[i]
+                    self.cell(col_widths[i], 7, HEADER_PT.get(header, header)[:20], 1, 0, 'C', True)
                 self.ln(7)
                 self.set_font('Helvetica', '', 8)
                 self.set_text_color(0, 0, 0)
                 self.set_fill_color(245, 245, 245)
             
-            x = x_start
-            for i, col in enumerate(headers):
-                value = row[col]
-                
-                # Formata valores
-                if pd.isna(value):
-                    text = '-'
-                elif isinstance(value, (int, float)):
-                    if 'affinity' in col.lower():
-                        text = f"{value:.2f}"
-                    elif 'score' in col.lower() or 'rank' in col.lower():
-                        text = f"{value:.3f}"
-                    else:
-                        text = f"{value:.2f}"
-                else:
-                    text = str(value)[:15]  # Limita tamanho
-                
-                self.set_xy(x, self.get_y())
-                self.cell(col_widths[i], 6, text, 1, 0, 'C', fill)
-                x += col_widths[i]
+            self.set_x(x_start)
+            for i, texts in enumerate(cell_texts):
+                self.cell(col_widths[i], 6, texts[row_idx], 1, 0, 'C', fill)
             
             self.ln(6)
             fill = not fill
@@ -230,8 +251,6 @@ Critérios de validação aplicados:
         """Adiciona seção de estatísticas."""
         self.chapter_title("Estatísticas Descritivas")
         
-        stats_text = []
-        
         # Estatísticas de afinidade
         if 'affinity_nm' in df.columns:
             aff_col = 'affinity_nm'
@@ -240,35 +259,24 @@ Critérios de validação aplicados:
         else:
             aff_col = None
         
-        if aff_col and not df[aff_col].isna().all():
-            aff_data = df[aff_col].dropna()
-        stats_text.append(f"Afinidade (nM):")
-        stats_text.append(f"  - Minima: {aff_data.min():.2f}")
-        stats_text.append(f"  - Maxima: {aff_data.max():.2f}")
-        stats_text.append(f"  - Media: {aff_data.mean():.2f}")
-        stats_text.append(f"  - Mediana: {aff_data.median():.2f}")
-        stats_text.append(f"  - Desvio Padrao: {aff_data.std():.2f}")
-        stats_text.append("")
+        if aff_col and df[aff_col].isna().all():
+            aff_col = None
         
-        # Estatísticas de tamanho
-        if 'length' in df.columns:
-            len_data = df['length']
-            stats_text.append(f"Tamanho dos peptideos:")
-            stats_text.append(f"  - Minimo: {len_data.min()} residuos")
-            stats_text.append(f"  - Maximo: {len_data.max()} residuos")
-            stats_text.append(f"  - Media: {len_data.mean():.1f} residuos")
-            stats_text.append("")
+        # Uma única passada de agregação para todas as colunas presentes;
+        # cada seção é preenchida a partir do seu template
+        sections = [(col, template) for col, template in (
+            (aff_col, _STATS_TEMPLATES['affinity']),
+            ('length', _STATS_TEMPLATES['length']),
+            ('gravy', _STATS_TEMPLATES['gravy']),
+        ) if col and col in df.columns]
         
-        # Estatísticas de GRAVY
-        if 'gravy' in df.columns:
-            gravy_data = df['gravy'].dropna()
-            stats_text.append(f"Indice GRAVY:")
-            stats_text.append(f"  - Minimo: {gravy_data.min():.3f}")
-            stats_text.append(f"  - Maximo: {gravy_data.max():.3f}")
-            stats_text.append(f"  - Media: {gravy_data.mean():.3f}")
+        stats_text = []
+        if sections:
+            stats = df[[col for col, _ in sections]].agg(['min', 'max', 'mean', 'median', 'std'])
+            stats_text = [template.format_map(stats[col].to_dict()) for col, template in sections]
         
         if stats_text:
-            self.add_text("\n".join(stats_text), font_size=10)
+            self.add_text("\n\n".join(stats_text), font_size=10)
         else:
             self.add_text("Estatisticas nao disponiveis para os dados fornecidos.", font_size=10)
 
@@ -345,6 +353,10 @@ def generate_simple_report(df: pd.DataFrame, output_path: str) -> str:
     return generate_report(df, output_path, include_statistics=False, max_table_rows=30)
 
 
+# Figura reutilizada entre chamadas de create_affinity_chart_image
+_CHART_FIG = None
+
+
 def create_affinity_chart_image(df: pd.DataFrame, max_peptides: int = 20) -> Optional[str]:
     """
     Cria gráfico de afinidade e salva como imagem temporária.
@@ -356,20 +368,27 @@ def create_affinity_chart_image(df: pd.DataFrame, max_peptides: int = 20) -> Opt
     Returns:
         Caminho da imagem temporária ou None
     """
+    global _CHART_FIG
+    
     if 'affinity_nm' not in df.columns or df['affinity_nm'].isna().all():
         return None
     
     try:
-        df_plot = df.head(max_peptides).copy()
-        df_plot = df_plot.sort_values('affinity_nm', ascending=True)
+        df_plot = df.head(max_peptides).sort_values('affinity_nm', ascending=True)
         
-        fig, ax = plt.subplots(figsize=(10, 6))
+        # Figura fora do pyplot: criada uma vez e limpa a cada chamada
+        if _CHART_FIG is None:
+            _CHART_FIG = Figure(figsize=(10, 6))
+        fig = _CHART_FIG
+        fig.clear()
+        ax = fig.add_subplot()
         
-        colors = ['#27AE60' if x < 50 else '#F39C12' if x < 500 else '#E74C3C' 
-                  for x in df_plot['affinity_nm']]
+        aff = df_plot['affinity_nm'].to_numpy()
+        colors = np.select([aff < 50, aff < 500], ['#27AE60', '#F39C12'], default='#E74C3C')
         
-        bars = ax.barh(range(len(df_plot)), df_plot['affinity_nm'], color=colors)
-        ax.set_yticks(range(len(df_plot)))
+        positions = np.arange(len(df_plot))
+        ax.barh(positions, aff, color=colors)
+        ax.set_yticks(positions)
         ax.set_yticklabels(df_plot['peptide'], fontsize=8)
         ax.set_xlabel('Afinidade (nM) - Menor é Melhor', fontweight='bold')
         ax.set_title(f'Top {max_peptides} Peptídeos por Afinidade (IC50)', fontweight='bold', fontsize=12)
@@ -377,12 +396,11 @@ def create_affinity_chart_image(df: pd.DataFrame, max_peptides: int = 20) -> Opt
         ax.legend()
         ax.grid(axis='x', alpha=0.3)
         
-        plt.tight_layout()
+        fig.tight_layout()
         
         # Salva em arquivo temporário
-        temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.png')
-        plt.savefig(temp_file.name, dpi=150, bbox_inches='tight')
-        plt.close()
+        with tempfile.NamedTemporaryFile(delete=False, suffix='.png') as temp_file:
+            fig.savefig(temp_file, format='png', dpi=150, bbox_inches='tight')
         
         return temp_file.name
     except Exception as e:
@@ -1,18 +1,80 @@
 import requests
-import pandas as pd
 import logging
+import hashlib
+import io
+import json
+import os
+import tempfile
+import time
 from concurrent.futures import ThreadPoolExecutor, as_completed
+from .http_retry import mount_adapter, retrying_adapter
 
 logger = logging.getLogger(__name__)
 
+# Tenta importar PyArrow (opcional) para o parser TSV das respostas da IEDB
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pacsv
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+# Colunas (posicionais) da resposta TSV da IEDB usadas nas predições MHC-II
+MHCII_COLUMNS = ['peptide', 'allele', 'method', 'ic50']
+
+# Validade das anotações do UniProt gravadas em disco (segundos)
+UNIPROT_CACHE_TTL = 24 * 60 * 60
+
 class APIClient:
-    def __init__(self):
+    def __init__(self, uniprot_cache_dir=None):
         self.iedb_url = "http://tools-cluster-interface.iedb.org/tools_api/mhcii/"
         self.uniprot_url = "https://www.ebi.ac.uk/proteins/api/proteins/"
+        # Sessão compartilhada: reaproveita conexões (keep-alive) entre
+        # requisições e threads, com respostas comprimidas e retentativas
+        self.session = requests.Session()
+        self.session.headers.update({
+            'Accept-Encoding': 'gzip, deflate',
+            'User-Agent': 'fest-peptideos/1.0',
+        })
+        mount_adapter(self.session,
+                      retrying_adapter(max_retries=3, pool_maxsize=32, pool_connections=16))
+        # Cache das anotações do UniProt: em memória + um arquivo JSON por
+        # proteína, nomeado pelo hash do ID (None desativa o disco)
+        if uniprot_cache_dir is None:
+            uniprot_cache_dir = os.path.join(tempfile.gettempdir(), 'uniprot_cache')
+        self.uniprot_cache_dir = uniprot_cache_dir
+        self._uniprot_cache = {}
 
     def predict_mhcii_iedb(self, peptides, allele, method='nn_align'):
-        """Faz predição de ligação MHC-II usando a IEDB API."""
-        predictions = []
+        """
+        Faz predição de ligação MHC-II usando a IEDB API.
+
+        Retorna um DataFrame com as colunas de MHCII_COLUMNS (ic50 NaN
+        quando a IEDB responde 'NA'; vazio em caso de erro).
+        """
+        return self._predict_mhcii_one(peptides, allele, method)
+
+    def predict_mhcii_iedb_batch(self, jobs, max_workers=8):
+        """
+        Faz várias predições MHC-II em paralelo (uma requisição por job).
+
+        jobs: lista de (peptides, allele, method). Retorna uma lista de
+        predições na mesma ordem dos jobs.
+        """
+        results = [_empty_mhcii_frame() for _ in jobs]
+        if not jobs:
+            return results
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(jobs))) as executor:
+            futures = {
+                executor.submit(self._predict_mhcii_one, peptides, allele, method): idx
+                for idx, (peptides, allele, method) in enumerate(jobs)
+            }
+            for future in as_completed(futures):
+                results[futures[future]] = future.result()
+        return results
+
+    def _predict_mhcii_one(self, peptides, allele, method):
+        predictions = _empty_mhcii_frame()
         try:
             # Formatar os dados para a requisição
             data = {
@@ -21,19 +83,9 @@ class APIClient:
                 'allele': allele,
                 'length': len(peptides[0]) if peptides else 0
             }
-            response = requests.post(self.iedb_url, data=data)
+            response = self.session.post(self.iedb_url, data=data)
             if response.status_code == 200:
-                lines = response.text.strip().split('\n')
-                # O formato da resposta é TSV, então vamos parsear
-                for line in lines[1:]:  # Pular cabeçalho
-                    parts = line.split('\t')
-                    if len(parts) >= 4:
-                        predictions.append({
-                            'peptide': parts[0],
-                            'allele': parts[1],
-                            'method': parts[2],
-                            'ic50': float(parts[3]) if parts[3] != 'NA' else None
-                        })
+                predictions = _parse_mhcii_tsv(response.content)
             else:
                 logger.error(f"Erro na requisição à IEDB API: {response.status_code}")
         except Exception as e:
@@ -42,13 +94,106 @@ class APIClient:
 
     def get_uniprot_annotation(self, protein_id):
         """Busca anotações do UniProt para uma proteína."""
+        if protein_id in self._uniprot_cache:
+            return self._uniprot_cache[protein_id]
+        cache_path = self._uniprot_cache_path(protein_id)
+        if cache_path and os.path.exists(cache_path):
+            try:
+                if time.time() - os.path.getmtime(cache_path) < UNIPROT_CACHE_TTL:
+                    with open(cache_path, 'r', encoding='utf-8') as f:
+                        annotation = json.load(f)
+                    self._uniprot_cache[protein_id] = annotation
+                    return annotation
+            except (OSError, ValueError) as e:
+                logger.warning(f"Cache do UniProt ilegível para {protein_id}: {e}")
         try:
-            response = requests.get(f"{self.uniprot_url}{protein_id}")
+            response = self.session.get(f"{self.uniprot_url}{protein_id}")
             if response.status_code == 200:
-                return response.json()
+                annotation = response.json()
+                self._uniprot_cache[protein_id] = annotation
+                self._store_uniprot_annotation(cache_path, annotation)
+                return annotation
             else:
                 logger.warning(f"Erro ao buscar anotações para {protein_id}: {response.status_code}")
                 return None
         except Exception as e:
             logger.error(f"Exceção ao buscar anotações do UniProt: {e}")
             return None
+
+    def _uniprot_cache_path(self, protein_id):
+        if not self.uniprot_cache_dir:
+            return None
+        digest = hashlib.sha256(str(protein_id).encode('utf-8')).hexdigest()
+        return os.path.join(self.uniprot_cache_dir, f"{digest}.json")
+
+    def _store_uniprot_annotation(self, cache_path, annotation):
+        if not cache_path:
+            return
+        try:
+            os.makedirs(self.uniprot_cache_dir, exist_ok=True)
+            # Grava em arquivo temporário e renomeia: leitores nunca veem JSON parcial
+            tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(annotation, f)
+            os.replace(tmp_path, cache_path)
+        except OSError as e:
+            logger.warning(f"Não foi possível gravar o cache do UniProt: {e}")
+
+
+def _empty_mhcii_frame():
+    import pandas as pd
+
+    return pd.DataFrame({col: pd.Series(dtype='float64' if col == 'ic50' else object)
+                         for col in MHCII_COLUMNS})
+
+
+def _parse_mhcii_tsv(content):
+    """Converte a resposta TSV da IEDB (bytes) em DataFrame, pulando o cabeçalho."""
+    if PYARROW_AVAILABLE:
+        df = _parse_mhcii_tsv_arrow(content)
+        if df is not None:
+            return df
+
+    # pandas só é carregado quando há uma resposta MHC-II para converter
+    import pandas as pd
+
+    # As quatro primeiras colunas por posição; linhas com menos de quatro
+    # campos ficam com ic50 vazio e são descartadas
+    try:
+        df = pd.read_csv(io.BytesIO(content), sep='\t', header=None, skiprows=1,
+                         usecols=range(len(MHCII_COLUMNS)), names=MHCII_COLUMNS,
+                         dtype=str, keep_default_na=False)
+    except pd.errors.EmptyDataError:
+        return _empty_mhcii_frame()
+    df = df[df['ic50'] != ''].reset_index(drop=True)
+    df['ic50'] = pd.to_numeric(df['ic50'].where(df['ic50'] != 'NA')).astype('float64')
+    return df
+
+
+def _skip_short_row(row):
+    # Linhas com menos campos que o esperado são descartadas (como no parser
+    # do pandas); linhas com campos a mais vão para o parser do pandas
+    return 'skip' if row.actual_columns < row.expected_columns else 'error'
+
+
+def _parse_mhcii_tsv_arrow(content):
+    """Parser TSV do PyArrow; None quando a resposta precisa do parser do pandas."""
+    n_cols = len(MHCII_COLUMNS)
+    try:
+        table = pacsv.read_csv(
+            pa.BufferReader(content),
+            read_options=pacsv.ReadOptions(skip_rows=1, autogenerate_column_names=True),
+            parse_options=pacsv.ParseOptions(delimiter='\t', invalid_row_handler=_skip_short_row),
+            convert_options=pacsv.ConvertOptions(
+                include_columns=[f'f{i}' for i in range(n_cols)],
+                column_types={f'f{i}': pa.string() for i in range(n_cols - 1)}
+                | {f'f{n_cols - 1}': pa.float64()},
+                null_values=['NA'],
+                strings_can_be_null=False,
+            ),
+        )
+    except (pa.ArrowInvalid, KeyError, TypeError):
+        # Resposta vazia, com menos de quatro colunas, ic50 não numérico ou
+        # PyArrow sem invalid_row_handler (< 7.0)
+        return None
+    return table.rename_columns(MHCII_COLUMNS).to_pandas()
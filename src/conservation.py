@@ -7,8 +7,7 @@ Calcula conservação usando múltiplos métodos.
 import logging
 import pandas as pd
 import numpy as np
-from typing import List, Dict, Optional
-from collections import Counter
+from typing import List, Dict, Optional, Tuple, Union
 
 # Configuração de logging
 logger = logging.getLogger(__name__)
@@ -22,6 +21,95 @@ except ImportError:
     BIO_ALIGN_AVAILABLE = False
     logger.warning("Bio.Align não disponível. Análise de conservação limitada.")
 
+# Tenta importar Numba (opcional) para o kernel Smith-Waterman compilado
+try:
+    from numba import njit, prange
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+# Matriz BLOSUM62 carregada uma vez por processo e compartilhada pelas instâncias,
+# com a tabela ASCII -> índice do alfabeto (caracteres fora do alfabeto = -1)
+_BLOSUM62 = None
+if BIO_ALIGN_AVAILABLE:
+    try:
+        _BLOSUM62 = substitution_matrices.load("BLOSUM62")
+    except Exception as e:
+        logger.warning(f"Não foi possível carregar matriz BLOSUM62: {e}")
+if _BLOSUM62 is not None:
+    _BLOSUM = np.asarray(_BLOSUM62, dtype=np.float32)
+    _AA_IDX = np.full(128, -1, dtype=np.int8)
+    for _i, _aa in enumerate(_BLOSUM62.alphabet):
+        _AA_IDX[ord(_aa)] = _i
+
+
+def _encode_sequences(sequences: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Codifica sequências como índices da BLOSUM62 em um único buffer.
+    
+    Args:
+        sequences: Lista de sequências
+        
+    Returns:
+        Tupla (buffer concatenado int8, offsets int64 com len(sequences) + 1 posições)
+    """
+    lengths = np.fromiter((len(s) for s in sequences), dtype=np.int64, count=len(sequences))
+    offsets = np.zeros(len(sequences) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    
+    # 'replace' mantém 1 byte por caractere; não-ASCII vira '?' (índice -1)
+    raw = np.frombuffer(''.join(sequences).encode('ascii', errors='replace'), dtype=np.uint8)
+    return _AA_IDX[raw], offsets
+
+
+if NUMBA_AVAILABLE:
+    @njit(cache=True, parallel=True)
+    def _sw_profile_batch(profiles, profile_offsets, refs_flat, ref_offsets, gap_open, gap_ext):
+        """
+        Smith-Waterman local (gaps afins) de vários peptídeos contra várias referências.
+        
+        Cada peptídeo entra como query profile (linha i = scores BLOSUM62 do
+        resíduo i contra todo o alfabeto), então o laço interno só faz uma
+        leitura de tabela por célula. Peptídeos são distribuídos entre threads.
+        
+        Retorna matriz (n_peptídeos, n_referências) de scores; NaN onde a
+        referência contém caracteres fora do alfabeto.
+        """
+        n_pep = profile_offsets.shape[0] - 1
+        n_ref = ref_offsets.shape[0] - 1
+        out = np.empty((n_pep, n_ref), dtype=np.float32)
+        for p in prange(n_pep):
+            start = profile_offsets[p]
+            m = profile_offsets[p + 1] - start
+            H = np.empty(m + 1, dtype=np.float32)
+            E = np.empty(m + 1, dtype=np.float32)
+            for r in range(n_ref):
+                H[:] = 0.0
+                E[:] = -1e9
+                best = np.float32(0.0)
+                valid = True
+                for j in range(ref_offsets[r], ref_offsets[r + 1]):
+                    b = refs_flat[j]
+                    if b < 0:
+                        valid = False
+                        break
+                    diag = np.float32(0.0)
+                    h_up = np.float32(0.0)
+                    F = np.float32(-1e9)
+                    for i in range(1, m + 1):
+                        old = H[i]
+                        e = max(old + gap_open, E[i] + gap_ext)
+                        E[i] = e
+                        F = max(h_up + gap_open, F + gap_ext)
+                        h = max(diag + profiles[start + i - 1, b], e, F, np.float32(0.0))
+                        diag = old
+                        H[i] = h
+                        h_up = h
+                        if h > best:
+                            best = h
+                out[p, r] = best if valid else np.nan
+        return out
+
 
 class ConservationAnalyzer:
     """Classe para análise de conservação de sequências."""
@@ -29,43 +117,131 @@ class ConservationAnalyzer:
     def __init__(self):
         """Inicializa analisador de conservação."""
         logger.info("ConservationAnalyzer inicializado")
+        # Referências codificadas da última chamada (reutilizadas entre peptídeos)
+        self._encoded_refs_key = None
+        self._encoded_refs = None
+        # Scores já calculados por peptídeo, válidos para as referências em _score_cache_key
+        self._score_cache_key = None
+        self._score_cache: Dict[str, Dict[str, float]] = {}
         if BIO_ALIGN_AVAILABLE:
             self.aligner = Align.PairwiseAligner()
             self.aligner.mode = 'local'
-            try:
-                self.aligner.substitution_matrix = substitution_matrices.load("BLOSUM62")
-            except:
-                logger.warning("Não foi possível carregar matriz BLOSUM62")
+            if _BLOSUM62 is not None:
+                self.aligner.substitution_matrix = _BLOSUM62
     
     @staticmethod
-    def calculate_shannon_entropy(sequences: List[str]) -> float:
+    def calculate_shannon_entropy(sequences: Union[List[str], np.ndarray]) -> float:
         """
         Calcula entropia de Shannon para uma posição alinhada.
         
         Args:
-            sequences: Lista de sequências alinhadas
+            sequences: Resíduos da posição alinhada (lista de caracteres ou
+                array NumPy de códigos, ex: uint8)
             
         Returns:
             Entropia de Shannon
         """
-        if not sequences:
+        if len(sequences) == 0:
             return 0.0
         
         try:
-            counter = Counter(sequences)
-            total = len(sequences)
-            
-            entropy = 0.0
-            for count in counter.values():
-                p = count / total
-                if p > 0:
-                    entropy -= p * np.log2(p)
+            if isinstance(sequences, np.ndarray):
+                arr = sequences
+            else:
+                joined = ''.join(sequences)
+                if len(joined) == len(sequences) and joined.isascii():
+                    # Um byte por resíduo: contagem direta sobre uint8
+                    arr = np.frombuffer(joined.encode('ascii'), dtype=np.uint8)
+                else:
+                    arr = np.asarray(sequences)
             
-            return entropy
+            _, counts = np.unique(arr, return_counts=True)
+            p = counts / counts.sum()
+            return float(0.0 - (p * np.log2(p)).sum())
         except Exception as e:
             logger.warning(f"Erro ao calcular entropia: {e}")
             return 0.0
     
+    @staticmethod
+    def _summarize_identities(identities: List[float], matches: int) -> Dict[str, float]:
+        """Combina identidades por referência nos scores de conservação."""
+        if not identities:
+            return {
+                'conservation_score': 0.0,
+                'max_identity': 0.0,
+                'mean_identity': 0.0,
+                'matches': 0
+            }
+        
+        max_identity = max(identities)
+        mean_identity = np.mean(identities)
+        conservation_score = (max_identity * 0.6 + mean_identity * 0.4)
+        
+        return {
+            'conservation_score': round(conservation_score, 4),
+            'max_identity': round(max_identity, 4),
+            'mean_identity': round(mean_identity, 4),
+            'matches': matches
+        }
+    
+    def _get_encoded_references(self, reference_sequences: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """Codifica as referências uma vez e reutiliza enquanto a lista não mudar."""
+        key = tuple(reference_sequences)
+        if key != self._encoded_refs_key:
+            self._encoded_refs = _encode_sequences(reference_sequences)
+            self._encoded_refs_key = key
+        return self._encoded_refs
+    
+    def calculate_conservation_scores(self, peptides: List[str],
+                                      reference_sequences: List[str]) -> List[Dict[str, float]]:
+        """
+        Calcula scores de conservação de vários peptídeos contra as mesmas referências.
+        
+        Com Numba, alinha todos os peptídeos em uma única chamada do kernel
+        compilado (query profile BLOSUM62, peptídeos em paralelo); sem Numba,
+        ou para peptídeos com caracteres fora do alfabeto, usa o PairwiseAligner.
+        
+        Args:
+            peptides: Lista de sequências de peptídeos
+            reference_sequences: Lista de sequências de referência
+            
+        Returns:
+            Lista de dicionários com scores de conservação, na ordem de ``peptides``
+        """
+        if not (NUMBA_AVAILABLE and _BLOSUM62 is not None and peptides and reference_sequences):
+            return [self._align_conservation_score(p, reference_sequences) for p in peptides]
+        
+        pep_flat, pep_offsets = _encode_sequences(peptides)
+        # Peptídeos vazios ou com caracteres fora do alfabeto ficam com o PairwiseAligner
+        pep_valid = np.diff(pep_offsets) > 0
+        invalid_pos = np.flatnonzero(pep_flat < 0)
+        pep_valid[np.searchsorted(pep_offsets, invalid_pos, side='right') - 1] = False
+        
+        kernel_idx = np.flatnonzero(pep_valid)
+        results: List[Optional[Dict[str, float]]] = [None] * len(peptides)
+        
+        if len(kernel_idx):
+            kernel_peps = [peptides[i] for i in kernel_idx]
+            codes, offsets = _encode_sequences(kernel_peps)
+            refs_flat, ref_offsets = self._get_encoded_references(reference_sequences)
+            scores = _sw_profile_batch(
+                _BLOSUM[codes], offsets, refs_flat, ref_offsets,
+                np.float32(self.aligner.open_gap_score), np.float32(self.aligner.extend_gap_score)
+            )
+            
+            for row, (idx, peptide) in enumerate(zip(kernel_idx, kernel_peps)):
+                row_scores = scores[row].astype(np.float64)
+                # Sem alinhamento local positivo, o PairwiseAligner não retorna alinhamentos
+                row_scores = row_scores[row_scores > 0]
+                identities = (row_scores / (len(peptide) * 2)).tolist()
+                matches = sum(identity > 0.8 for identity in identities)
+                results[idx] = self._summarize_identities(identities, matches)
+        
+        for idx in np.flatnonzero(~pep_valid):
+            results[idx] = self._align_conservation_score(peptides[idx], reference_sequences)
+        
+        return results
+    
     def calculate_conservation_score(self, peptide: str, reference_sequences: List[str]) -> Dict[str, float]:
         """
         Calcula score de conservação de um peptídeo em relação a sequências de referência.
@@ -77,6 +253,22 @@ class ConservationAnalyzer:
         Returns:
             Dicionário com scores de conservação
         """
+        key = tuple(reference_sequences)
+        if key != self._score_cache_key:
+            self._score_cache = {}
+            self._score_cache_key = key
+        
+        cached = self._score_cache.get(peptide)
+        if cached is None:
+            if NUMBA_AVAILABLE and _BLOSUM62 is not None and reference_sequences:
+                cached = self.calculate_conservation_scores([peptide], reference_sequences)[0]
+            else:
+                cached = self._align_conservation_score(peptide, reference_sequences)
+            self._score_cache[peptide] = cached
+        return dict(cached)
+    
+    def _align_conservation_score(self, peptide: str, reference_sequences: List[str]) -> Dict[str, float]:
+        """Score de conservação via PairwiseAligner, uma referência por vez."""
         if not reference_sequences:
             return {
                 'conservation_score': 0.0,
@@ -120,24 +312,7 @@ class ConservationAnalyzer:
                 'matches': 0
             }
         
-        if not identities:
-            return {
-                'conservation_score': 0.0,
-                'max_identity': 0.0,
-                'mean_identity': 0.0,
-                'matches': 0
-            }
-        
-        max_identity = max(identities)
-        mean_identity = np.mean(identities)
-        conservation_score = (max_identity * 0.6 + mean_identity * 0.4)
-        
-        return {
-            'conservation_score': round(conservation_score, 4),
-            'max_identity': round(max_identity, 4),
-            'mean_identity': round(mean_identity, 4),
-            'matches': matches
-        }
+        return self._summarize_identities(identities, matches)
     
     def calculate_positional_conservation(self, peptides: List[str]) -> pd.DataFrame:
         """
@@ -154,22 +329,40 @@ class ConservationAnalyzer:
         
         try:
             max_len = max(len(p) for p in peptides)
-            aligned = [p.ljust(max_len, '-') for p in peptides]
+            n_peptides = len(peptides)
+            
+            # Matriz (N, L) de bytes com padding de gaps
+            aligned = ''.join(p.ljust(max_len, '-') for p in peptides).encode('ascii', errors='replace')
+            matrix = np.frombuffer(aligned, dtype=np.uint8).reshape(n_peptides, max_len)
+            col_idx = np.broadcast_to(np.arange(max_len), matrix.shape)
+            
+            # Contagens (L, 128 símbolos ASCII) em uma passada; gaps não contam
+            counts = np.bincount(
+                (col_idx * 128 + matrix).ravel(), minlength=max_len * 128
+            ).reshape(max_len, 128)
+            counts[:, ord('-')] = 0
+            totals = counts.sum(axis=1)
+            present = totals > 0
             
-            positions = []
-            for pos in range(max_len):
-                column = [seq[pos] for seq in aligned if seq[pos] != '-']
-                if column:
-                    entropy = self.calculate_shannon_entropy(column)
-                    conservation = 1 - (entropy / 4.32) if entropy > 0 else 1.0
-                    positions.append({
-                        'position': pos + 1,
-                        'entropy': round(entropy, 4),
-                        'conservation': round(conservation, 4),
-                        'most_common_aa': Counter(column).most_common(1)[0][0] if column else '-'
-                    })
+            with np.errstate(divide='ignore', invalid='ignore'):
+                probs = counts / totals[:, None]
+            # log2 só onde P > 0 e produto + soma por posição fundidos no einsum
+            log_probs = np.log2(probs, where=probs > 0, out=np.zeros_like(probs))
+            entropy = 0.0 - np.einsum('la,la->l', probs, log_probs)
+            conservation = np.where(entropy > 0, 1 - entropy / 4.32, 1.0)
             
-            return pd.DataFrame(positions)
+            # Resíduo mais comum; empates resolvidos pela primeira ocorrência (como Counter)
+            first_seen = np.full((max_len, 128), n_peptides, dtype=np.int64)
+            np.minimum.at(first_seen, (col_idx, matrix), np.arange(n_peptides)[:, None])
+            is_top = counts == counts.max(axis=1, keepdims=True)
+            most_common = np.where(is_top, first_seen, n_peptides).argmin(axis=1)
+            
+            return pd.DataFrame({
+                'position': np.arange(1, max_len + 1)[present],
+                'entropy': np.round(entropy[present], 4),
+                'conservation': np.round(conservation[present], 4),
+                'most_common_aa': [chr(c) for c in most_common[present]]
+            })
         except Exception as e:
             logger.error(f"Erro ao calcular conservação posicional: {e}")
             return pd.DataFrame()
@@ -189,8 +382,9 @@ class ConservationAnalyzer:
         if 'peptide' not in df.columns:
             raise ValueError("DataFrame deve conter coluna 'peptide'")
         
-        df_result = df.copy()
-        peptides = df_result['peptide'].tolist()
+        # Monta apenas as colunas novas (evita copiar o DataFrame inteiro)
+        new_cols = {}
+        peptides = df['peptide'].tolist()
         
         logger.info(f"Calculando conservação para {len(peptides)} peptídeos...")
         
@@ -198,27 +392,29 @@ class ConservationAnalyzer:
         try:
             pos_conservation = self.calculate_positional_conservation(peptides)
             if not pos_conservation.empty:
-                mean_conservation = pos_conservation['conservation'].mean()
-                df_result['positional_conservation'] = mean_conservation
+                new_cols['positional_conservation'] = pos_conservation['conservation'].mean()
             else:
-                df_result['positional_conservation'] = 0.0
+                new_cols['positional_conservation'] = 0.0
         except Exception as e:
             logger.warning(f"Erro ao calcular conservação posicional: {e}")
-            df_result['positional_conservation'] = 0.0
+            new_cols['positional_conservation'] = 0.0
         
         # Conservação em relação a sequências de referência (se fornecidas)
         if reference_sequences:
             try:
-                conservation_scores = []
-                for peptide in peptides:
-                    scores = self.calculate_conservation_score(peptide, reference_sequences)
-                    conservation_scores.append(scores['conservation_score'])
-                df_result['reference_conservation'] = conservation_scores
+                scores = self.calculate_conservation_scores(peptides, reference_sequences)
+                new_cols['reference_conservation'] = [sc['conservation_score'] for sc in scores]
             except Exception as e:
                 logger.warning(f"Erro ao calcular conservação de referência: {e}")
-                df_result['reference_conservation'] = 0.0
+                new_cols['reference_conservation'] = 0.0
         else:
-            df_result['reference_conservation'] = 0.0
+            new_cols['reference_conservation'] = 0.0
+        
+        # Remove colunas que serão substituídas antes de concatenar
+        cols_to_remove = [c for c in new_cols if c in df.columns]
+        if cols_to_remove:
+            df = df.drop(columns=cols_to_remove)
+        df_result = pd.concat([df, pd.DataFrame(new_cols, index=df.index)], axis=1, copy=False)
         
         logger.info("Conservação calculada com sucesso")
         return df_result
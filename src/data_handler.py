@@ -28,11 +28,11 @@ class FastaProcessor:
 
     def generate_peptides(self, sequence, lengths):
         """Gera peptídeos de um determinado comprimento a partir de uma sequência."""
+        # Fatiar str é muito mais barato que fatiar Bio.Seq (um objeto Seq por janela)
+        seq = str(sequence)
         peptides = []
         for length in lengths:
-            for i in range(len(sequence) - length + 1):
-                peptide = sequence[i:i+length]
-                peptides.append(peptide)
+            peptides.extend([seq[i:i+length] for i in range(len(seq) - length + 1)])
         return peptides
 
     def calculate_physicochemical(self, sequence):
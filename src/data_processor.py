@@ -11,11 +11,135 @@ import pandas as pd
 import numpy as np
 from typing import List, Dict, Optional, Union
 from Bio import SeqIO
-from Bio.SeqUtils.ProtParam import ProteinAnalysis
+from Bio.Data import IUPACData
+from Bio.SeqUtils import IsoelectricPoint, ProtParamData
 
 # Configuração de logging
 logger = logging.getLogger(__name__)
 
+# Tenta importar Numba (opcional) para o kernel do índice de instabilidade
+try:
+    from numba import njit, prange
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+# Tenta importar PyArrow (opcional) para strings em buffers nativos na limpeza
+try:
+    import pyarrow  # noqa: F401
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+# Dtype usado na limpeza das colunas de peptídeos (strip/upper/len em código nativo)
+_STRING_DTYPE = 'string[pyarrow]' if PYARROW_AVAILABLE else 'string'
+
+# Tabelas por resíduo para propriedades físico-químicas em lote, montadas a partir
+# dos mesmos dados do Biopython usados por ProteinAnalysis. Índices 0-19 são os
+# aminoácidos canônicos; o índice 20 é o padding (contribuição zero).
+_CANONICAL_AA = "ACDEFGHIKLMNPQRSTVWY"
+_PAD_IDX = len(_CANONICAL_AA)
+_AA_INDEX = np.full(128, _PAD_IDX, dtype=np.intp)
+_AA_INDEX[[ord(aa) for aa in _CANONICAL_AA]] = np.arange(_PAD_IDX)
+
+_AVERAGE_WATER = 18.0153  # Bio.SeqUtils.molecular_weight (massas médias)
+_MW_TABLE = np.array([IUPACData.protein_weights[aa] for aa in _CANONICAL_AA] + [0.0])
+_GRAVY_TABLE = np.array([ProtParamData.kd[aa] for aa in _CANONICAL_AA] + [0.0])
+_DIWV_TABLE = np.zeros((_PAD_IDX + 1, _PAD_IDX + 1))
+_DIWV_TABLE[:_PAD_IDX, :_PAD_IDX] = [
+    [ProtParamData.DIWV[a][b] for b in _CANONICAL_AA] for a in _CANONICAL_AA
+]
+
+# pKs de Bjellqvist (Bio.SeqUtils.IsoelectricPoint), na mesma ordem de soma
+_PI_POSITIVE = [(aa, pk) for aa, pk in IsoelectricPoint.positive_pKs.items() if aa != "Nterm"]
+_PI_NEGATIVE = [(aa, pk) for aa, pk in IsoelectricPoint.negative_pKs.items() if aa != "Cterm"]
+_PK_NTERM = np.full(_PAD_IDX, IsoelectricPoint.positive_pKs["Nterm"])
+_PK_CTERM = np.full(_PAD_IDX, IsoelectricPoint.negative_pKs["Cterm"])
+for _aa, _pk in IsoelectricPoint.pKnterminal.items():
+    _PK_NTERM[_CANONICAL_AA.index(_aa)] = _pk
+for _aa, _pk in IsoelectricPoint.pKcterminal.items():
+    _PK_CTERM[_CANONICAL_AA.index(_aa)] = _pk
+
+
+def _sequential_row_sum(values: np.ndarray) -> np.ndarray:
+    """
+    Soma as linhas de uma matriz coluna a coluna, a partir de 0.0.
+    
+    Mesma ordem de soma de sum() sobre a sequência, então os arredondamentos
+    finais coincidem com o cálculo escalar (np.sum usa soma em pares).
+    """
+    total = np.zeros(values.shape[0])
+    for col in range(values.shape[1]):
+        total += values[:, col]
+    return total
+
+
+if NUMBA_AVAILABLE:
+    @njit(cache=True, parallel=True)
+    def _instability_kernel(codes, lengths, diwv):
+        """
+        Índice de instabilidade (Guruprasad) de cada linha da matriz de códigos.
+        
+        Soma os valores DIWV dos dipeptídeos em ordem, a partir de 0.0, e
+        escala por 10 / L, como ProteinAnalysis.instability_index.
+        """
+        out = np.empty(codes.shape[0])
+        for i in prange(codes.shape[0]):
+            score = 0.0
+            for k in range(lengths[i] - 1):
+                score += diwv[codes[i, k], codes[i, k + 1]]
+            out[i] = (10.0 / lengths[i]) * score
+        return out
+
+
+def _instability_indices(codes: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+    """Índice de instabilidade em lote (kernel Numba ou soma sequencial em NumPy)."""
+    if NUMBA_AVAILABLE:
+        return _instability_kernel(codes, lengths, _DIWV_TABLE)
+    return (10.0 / lengths) * _sequential_row_sum(_DIWV_TABLE[codes[:, :-1], codes[:, 1:]])
+
+
+def _isoelectric_points(codes: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+    """
+    Ponto isoelétrico (Bjellqvist) de vários peptídeos por bissecção vetorizada.
+    
+    Reproduz IsoelectricPoint.pi(): mesmo intervalo inicial (4.05-12), mesmo
+    critério de parada (0.0001) e mesma ordem dos termos de carga, com todos
+    os peptídeos avançando juntos.
+    
+    Args:
+        codes: Matriz (N, L) de índices de resíduos (_PAD_IDX no padding)
+        lengths: Tamanho de cada peptídeo
+    """
+    rows = np.arange(len(codes))
+    pk_nterm = _PK_NTERM[codes[:, 0]]
+    pk_cterm = _PK_CTERM[codes[rows, lengths - 1]]
+    pos_counts = [((codes == _CANONICAL_AA.index(aa)).sum(axis=1).astype(float), pk)
+                  for aa, pk in _PI_POSITIVE]
+    neg_counts = [((codes == _CANONICAL_AA.index(aa)).sum(axis=1).astype(float), pk)
+                  for aa, pk in _PI_NEGATIVE]
+    
+    def charge_at_ph(ph):
+        positive = 0.0 + 1.0 * (1.0 / (10 ** (ph - pk_nterm) + 1.0))
+        for count, pk in pos_counts:
+            positive = positive + count * (1.0 / (10 ** (ph - pk) + 1.0))
+        negative = 0.0 + 1.0 * (1.0 / (10 ** (pk_cterm - ph) + 1.0))
+        for count, pk in neg_counts:
+            negative = negative + count * (1.0 / (10 ** (pk - ph) + 1.0))
+        return positive - negative
+    
+    ph = np.full(len(codes), 7.775)
+    low = np.full(len(codes), 4.05)
+    high = np.full(len(codes), 12.0)
+    active = high - low > 0.0001
+    while active.any():
+        positive = charge_at_ph(ph) > 0.0
+        low = np.where(active & positive, ph, low)
+        high = np.where(active & ~positive, ph, high)
+        ph = np.where(active, (low + high) / 2, ph)
+        active = high - low > 0.0001
+    return ph
+
 
 class FastaProcessor:
     """Classe para processamento de arquivos FASTA e validação de peptídeos."""
@@ -29,6 +153,23 @@ class FastaProcessor:
         'T': -0.7, 'V': 4.2, 'W': -0.9, 'Y': -1.3
     }
     
+    # Mesma escala indexada por código ASCII (0.0 fora da escala), para cálculo vetorizado
+    KD_LUT = np.zeros(128)
+    KD_LUT[[ord(aa) for aa in KD_SCALE]] = list(KD_SCALE.values())
+    
+    # Máscara de bytes dos 20 aminoácidos canônicos (mesmo alfabeto de aa_regex)
+    ALLOWED_AA = np.zeros(256, dtype=bool)
+    ALLOWED_AA[[ord(aa) for aa in "ACDEFGHIKLMNPQRSTVWY"]] = True
+    
+    # Bytes removidos das sequências FASTA (tudo fora dos 20 aminoácidos canônicos)
+    NON_AA_BYTES = np.flatnonzero(~ALLOWED_AA).astype(np.uint8).tobytes()
+    
+    # Ordem das colunas de propriedades físico-químicas
+    PHYSCHEM_COLUMNS = (
+        "length", "mw", "pI", "gravy",
+        "kd_hydrophobicity", "instability_index", "aliphatic_index"
+    )
+    
     def __init__(self, min_length: int = 8, max_length: int = 14):
         """
         Inicializa processador de FASTA.
@@ -56,15 +197,16 @@ class FastaProcessor:
             ValueError: Se nenhuma sequência válida for encontrada
         """
         try:
-            file_string = file_bytes.decode('utf-8')
-            file_io = io.StringIO(file_string)
+            # Decodifica incrementalmente enquanto o SeqIO lê (sem cópia str do arquivo todo);
+            # bytes não-ASCII só aparecem em cabeçalhos ou seriam removidos da sequência
+            file_io = io.TextIOWrapper(io.BytesIO(file_bytes), encoding='ascii', errors='ignore')
             
             peptides = []
             for record in SeqIO.parse(file_io, "fasta"):
-                seq = str(record.seq).upper()
-                seq = re.sub(r'[^ACDEFGHIKLMNPQRSTVWY]', '', seq)
+                # Remove tudo que não é aminoácido canônico em uma passada (em C)
+                seq = bytes(record.seq).upper().translate(None, self.NON_AA_BYTES)
                 if seq:
-                    peptides.append(seq)
+                    peptides.append(seq.decode('ascii'))
             
             if not peptides:
                 raise ValueError("Nenhuma sequência válida encontrada no arquivo FASTA")
@@ -90,15 +232,21 @@ class FastaProcessor:
             DataFrame com coluna 'peptide'
         """
         try:
-            if filename.lower().endswith('.tsv') or (sep is None and '\t' in file_bytes.decode('utf-8', errors='ignore')[:1000]):
-                df = pd.read_csv(io.BytesIO(file_bytes), sep='\t', header=None)
-            else:
-                df = pd.read_csv(io.BytesIO(file_bytes), sep=sep if sep else ',', header=None)
+            # Sniff do separador direto nos bytes: evita decodificar o arquivo inteiro
+            if filename.lower().endswith('.tsv') or (sep is None and b'\t' in file_bytes[:1000]):
+                sep = '\t'
+            df = pd.read_csv(io.BytesIO(file_bytes), sep=sep if sep else ',', header=None,
+                             dtype=str, engine='c')
             
-            peptides_flat = df.values.flatten()
-            df_clean = pd.DataFrame(peptides_flat, columns=['peptide'])
+            if df.shape[1] == 1:
+                peptides_flat = df.iloc[:, 0]
+            else:
+                # Concatena as colunas e reordena pelo índice da linha (ordenação estável),
+                # reproduzindo a ordem de values.flatten() sem materializar a matriz
+                peptides_flat = pd.concat([df[col] for col in df.columns]).sort_index(kind='stable')
+            df_clean = peptides_flat.reset_index(drop=True).to_frame('peptide')
             df_clean = df_clean.dropna()
-            df_clean['peptide'] = df_clean['peptide'].astype(str).str.strip()
+            df_clean['peptide'] = df_clean['peptide'].astype(_STRING_DTYPE).str.strip()
             df_clean = df_clean[df_clean['peptide'] != '']
             
             logger.info(f"Lidos {len(df_clean)} peptídeos do arquivo {filename}")
@@ -126,15 +274,11 @@ class FastaProcessor:
             if 'peptide' in df.columns:
                 df_clean = df[['peptide']].copy()
             else:
-                for col in df.columns:
-                    if df[col].astype(str).str.match(r'^[ACDEFGHIKLMNPQRSTVWY]+$').any():
-                        df_clean = pd.DataFrame({'peptide': df[col]})
-                        break
-                else:
-                    df_clean = pd.DataFrame({'peptide': df.iloc[:, 0]})
+                col = self._detect_peptide_column(df)
+                df_clean = pd.DataFrame({'peptide': df[col] if col is not None else df.iloc[:, 0]})
             
             df_clean = df_clean.dropna()
-            df_clean['peptide'] = df_clean['peptide'].astype(str).str.strip()
+            df_clean['peptide'] = df_clean['peptide'].astype(_STRING_DTYPE).str.strip()
             df_clean = df_clean[df_clean['peptide'] != '']
             
             logger.info(f"Lidos {len(df_clean)} peptídeos do arquivo Excel")
@@ -144,6 +288,33 @@ class FastaProcessor:
             logger.error(f"Erro ao ler Excel: {e}")
             raise ValueError(f"Erro ao ler arquivo Excel: {e}")
     
+    @staticmethod
+    def _detect_peptide_column(df: pd.DataFrame):
+        """
+        Encontra a coluna de peptídeos de uma planilha sem coluna 'peptide'.
+        
+        Primeiro testa apenas a primeira célula não nula de cada coluna contra a
+        máscara de bytes ALLOWED_AA; só se nenhuma passar recorre à busca por
+        regex em todas as células.
+        
+        Returns:
+            Rótulo da coluna, ou None se nenhuma parecer conter peptídeos
+        """
+        for col in df.columns:
+            not_null = np.flatnonzero(df[col].notna().to_numpy())
+            if not len(not_null):
+                continue
+            value = str(df[col].iat[not_null[0]]).strip().upper()
+            if value and value.isascii() and \
+                    FastaProcessor.ALLOWED_AA[np.frombuffer(value.encode('ascii'), dtype=np.uint8)].all():
+                return col
+        
+        # Planilhas ambíguas (ex: primeira linha fora do padrão): varredura completa
+        for col in df.columns:
+            if df[col].astype(_STRING_DTYPE).str.match(r'^[ACDEFGHIKLMNPQRSTVWY]+$').any():
+                return col
+        return None
+    
     def load_peptides_from_bytes(self, file_bytes: bytes, filename: str) -> pd.DataFrame:
         """
         Carrega peptídeos a partir de bytes (para uso com Streamlit file_uploader).
@@ -183,24 +354,46 @@ class FastaProcessor:
             raise ValueError("DataFrame deve conter coluna 'peptide'")
         
         initial_count = len(df)
-        df = df.copy()
         
-        # Padroniza para maiúsculas
-        df['peptide'] = df['peptide'].astype(str).str.upper().str.strip()
+        # Padroniza para maiúsculas (série nova; o DataFrame de entrada não é alterado).
+        # Valores ausentes viram '' e são descartados como inválidos
+        peptides = df['peptide'].astype(_STRING_DTYPE).fillna('').str.upper().str.strip()
         
-        # Valida sequências
-        df["valid"] = df['peptide'].apply(lambda x: bool(self.aa_regex.match(x)))
+        # Válidos, primeira ocorrência de cada sequência e dentro da faixa de tamanho
+        keep = (
+            self._canonical_mask(peptides)
+            & ~peptides.duplicated().to_numpy()
+            & peptides.str.len().between(self.min_length, self.max_length).to_numpy()
+        )
         
-        # Remove inválidos e duplicatas
-        df_valid = df[df["valid"]].drop(columns=["valid"]).drop_duplicates(subset=['peptide']).copy()
-        
-        # Filtro de tamanho
-        df_valid = df_valid[df_valid['peptide'].str.len().between(self.min_length, self.max_length)]
+        # Materializa apenas as linhas mantidas
+        df_valid = df.loc[keep].reset_index(drop=True)
+        df_valid['peptide'] = peptides.to_numpy()[keep]
         
         final_count = len(df_valid)
         logger.info(f"Validação: {initial_count} → {final_count} peptídeos válidos")
         
-        return df_valid.reset_index(drop=True)
+        return df_valid
+    
+    @staticmethod
+    def _canonical_mask(peptides) -> np.ndarray:
+        """
+        Indica quais peptídeos são não vazios e só têm aminoácidos canônicos.
+        
+        Equivale a aa_regex.match por peptídeo, mas verifica todos os bytes de
+        uma vez no buffer concatenado e atribui os inválidos ao seu peptídeo.
+        """
+        peptides = list(peptides)
+        lengths = np.fromiter(map(len, peptides), dtype=np.int64, count=len(peptides))
+        offsets = np.cumsum(lengths)
+        
+        # 'replace' mantém 1 byte por caractere; não-ASCII vira '?' (inválido)
+        codes = np.frombuffer(''.join(peptides).encode('ascii', errors='replace'), dtype=np.uint8)
+        bad_pos = np.flatnonzero(~FastaProcessor.ALLOWED_AA[codes])
+        
+        valid = lengths > 0
+        valid[np.searchsorted(offsets, bad_pos, side='right')] = False
+        return valid
     
     @staticmethod
     def calculate_kyte_doolittle_hydrophobicity(peptide: str) -> float:
@@ -223,112 +416,148 @@ class FastaProcessor:
             logger.warning(f"Erro ao calcular hidrofobicidade para {peptide}: {e}")
             return 0.0
     
-    def calculate_physchem_properties(self, peptide: str) -> Dict[str, float]:
+    @staticmethod
+    def calculate_kyte_doolittle_batch(peptides) -> np.ndarray:
         """
-        Calcula propriedades físico-químicas de um peptídeo.
+        Hidrofobicidade Kyte-Doolittle média de vários peptídeos de uma vez.
+        
+        Equivalente a calculate_kyte_doolittle_hydrophobicity por peptídeo: os
+        peptídeos viram uma matriz (N, L) de códigos ASCII com padding nulo, a
+        tabela KD_LUT é consultada uma única vez e as somas são acumuladas
+        posição a posição (mesma ordem de soma da versão escalar, então o
+        arredondamento bate exatamente).
         
         Args:
-            peptide: Sequência do peptídeo
+            peptides: Sequência (lista, array ou Series) de peptídeos
             
         Returns:
-            Dicionário com propriedades calculadas
+            Array float64 com a hidrofobicidade média (0.0 para peptídeos vazios)
         """
-        try:
-            pa = ProteinAnalysis(peptide)
+        peptides = list(peptides)
+        if not peptides:
+            return np.zeros(0)
+        
+        lengths = np.fromiter(map(len, peptides), dtype=np.int64, count=len(peptides))
+        max_len = int(lengths.max())
+        if max_len == 0:
+            return np.zeros(len(peptides))
+        
+        # 'replace' mantém 1 byte por caractere; não-ASCII vira '?' e o padding '\0' (ambos 0.0)
+        padded = ''.join(p.ljust(max_len, '\0') for p in peptides)
+        codes = np.frombuffer(padded.encode('ascii', errors='replace').upper(), dtype=np.uint8)
+        values = FastaProcessor.KD_LUT[codes].reshape(len(peptides), max_len)
+        
+        sums = np.zeros(len(peptides))
+        for pos in range(max_len):
+            sums += values[:, pos]
+        
+        means = np.divide(sums, lengths, out=np.zeros(len(peptides)), where=lengths > 0)
+        # round() do Python, como na versão escalar (np.round diverge em empates como 0.4875)
+        return np.array([round(v, 3) for v in means.tolist()])
+    
+    @staticmethod
+    def calculate_physchem_batch(peptides) -> pd.DataFrame:
+        """
+        Calcula propriedades físico-químicas de vários peptídeos de uma vez.
+        
+        Usa tabelas por resíduo (massa, Kyte-Doolittle, dipeptídeos DIWV, pKs)
+        sobre uma matriz (N, L) de índices, sem construir um ProteinAnalysis
+        por peptídeo; os valores coincidem com os do ProteinAnalysis.
+        Peptídeos vazios ou com resíduos não canônicos recebem zeros (exceto
+        length e kd_hydrophobicity).
+        
+        Args:
+            peptides: Sequência (lista, array ou Series) de peptídeos
             
-            properties = {
-                "length": len(peptide),
-                "mw": round(pa.molecular_weight(), 2),
-                "pI": round(pa.isoelectric_point(), 2),
-                "gravy": round(pa.gravy(), 3),
-                "kd_hydrophobicity": self.calculate_kyte_doolittle_hydrophobicity(peptide),
-            }
+        Returns:
+            DataFrame com as colunas de PHYSCHEM_COLUMNS, uma linha por peptídeo
+        """
+        peptides = list(peptides)
+        n_peptides = len(peptides)
+        lengths = np.fromiter(map(len, peptides), dtype=np.int64, count=n_peptides)
+        
+        props = {col: np.zeros(n_peptides) for col in FastaProcessor.PHYSCHEM_COLUMNS}
+        props["length"] = lengths
+        props["kd_hydrophobicity"] = FastaProcessor.calculate_kyte_doolittle_batch(peptides)
+        
+        upper = [p.upper() for p in peptides]
+        valid_idx = np.flatnonzero(FastaProcessor._canonical_mask(upper))
+        if len(valid_idx):
+            seqs = [upper[i] for i in valid_idx]
+            seq_len = lengths[valid_idx]
+            max_len = int(seq_len.max())
+            padded = ''.join(seq.ljust(max_len, '\0') for seq in seqs)
+            codes = _AA_INDEX[np.frombuffer(padded.encode('ascii'), dtype=np.uint8)]
+            codes = codes.reshape(len(seqs), max_len)
             
-            # Índice de instabilidade
-            try:
-                properties["instability_index"] = round(pa.instability_index(), 2)
-            except:
-                properties["instability_index"] = 0.0
+            mw = _sequential_row_sum(_MW_TABLE[codes]) - (seq_len - 1) * _AVERAGE_WATER
+            gravy = _sequential_row_sum(_GRAVY_TABLE[codes]) / seq_len
+            instability = _instability_indices(codes, seq_len)
             
-            # Índice alifático
-            try:
-                aa_percent = pa.get_amino_acids_percent()
-                properties["aliphatic_index"] = round(
-                    (aa_percent.get('A', 0) + 2.9 * aa_percent.get('V', 0) + 
-                     3.9 * (aa_percent.get('I', 0) + aa_percent.get('L', 0))) * 100, 2
-                )
-            except:
-                properties["aliphatic_index"] = 0.0
+            # Índice alifático: frações de A, V, I, L (× 100)
+            frac = {aa: (codes == _CANONICAL_AA.index(aa)).sum(axis=1) / seq_len for aa in "AVIL"}
+            aliphatic = (frac['A'] + 2.9 * frac['V'] + 3.9 * (frac['I'] + frac['L'])) * 100
             
-            return properties
+            p_i = _isoelectric_points(codes, seq_len)
             
-        except Exception as e:
-            logger.warning(f"Erro ao calcular propriedades para {peptide}: {e}")
-            return {
-                "length": len(peptide),
-                "mw": 0.0,
-                "pI": 0.0,
-                "gravy": 0.0,
-                "kd_hydrophobicity": 0.0,
-                "instability_index": 0.0,
-                "aliphatic_index": 0.0
-            }
+            # round() do Python, como na versão escalar
+            for col, values, ndigits in (("mw", mw, 2), ("pI", p_i, 2), ("gravy", gravy, 3),
+                                         ("instability_index", instability, 2),
+                                         ("aliphatic_index", aliphatic, 2)):
+                props[col][valid_idx] = [round(v, ndigits) for v in values.tolist()]
+        
+        return pd.DataFrame(props, columns=list(FastaProcessor.PHYSCHEM_COLUMNS))
+    
+    @staticmethod
+    def calculate_physchem_properties(peptide: str) -> Dict[str, float]:
+        """
+        Calcula propriedades físico-químicas de um peptídeo.
+        
+        Args:
+            peptide: Sequência do peptídeo
+            
+        Returns:
+            Dicionário com propriedades calculadas
+        """
+        row = FastaProcessor.calculate_physchem_batch([peptide]).iloc[0]
+        properties = {col: float(row[col]) for col in FastaProcessor.PHYSCHEM_COLUMNS}
+        properties["length"] = len(peptide)
+        return properties
     
     def add_physchem_properties(self, df: pd.DataFrame) -> pd.DataFrame:
         """
         Adiciona propriedades físico-químicas ao DataFrame.
         
+        Propriedades são calculadas uma vez por sequência única e replicadas
+        para linhas com peptídeos repetidos.
+        
         Args:
             df: DataFrame com coluna 'peptide'
             
         Returns:
             DataFrame com colunas adicionais de propriedades
         """
+        if df is None or df.empty:
+            return df
+        
         if 'peptide' not in df.columns:
             raise ValueError("DataFrame deve conter coluna 'peptide'")
         
         logger.info(f"Calculando propriedades físico-químicas para {len(df)} peptídeos...")
         
-        props = df['peptide'].apply(self.calculate_physchem_properties).apply(pd.Series)
+        # Calcula propriedades apenas para peptídeos únicos, em lote
+        unique_peps = df['peptide'].drop_duplicates()
+        props = self.calculate_physchem_batch(unique_peps)
+        props.index = unique_peps.to_numpy()
+        logger.info(f"{len(props)} peptídeos únicos calculados")
         
-        # Remove colunas duplicadas antes de concatenar
+        # Remove colunas duplicadas antes de juntar
         cols_to_remove = [c for c in props.columns if c in df.columns]
         if cols_to_remove:
             df = df.drop(columns=cols_to_remove)
         
-        df_result = pd.concat([df.reset_index(drop=True), props.reset_index(drop=True)], axis=1)
+        # Junta propriedades por sequência
+        df_result = df.reset_index(drop=True).merge(props, left_on='peptide', right_index=True, how='left')
         
         logger.info("Propriedades físico-químicas calculadas com sucesso")
-        def add_physchem_properties(df: pd.DataFrame) -> pd.DataFrame:
-    """
-    Adiciona propriedades físico-químicas ao DataFrame de peptídeos.
-    """
-    # --- PROTEÇÃO CONTRA DATAFRAME VAZIO ---
-    if df is None or df.empty:
-        return df
-    # ---------------------------------------
-
-    if 'peptide' not in df.columns:
-        raise ValueError("DataFrame deve conter coluna 'peptide'")
-    
-    # Calcula propriedades para cada peptídeo
-    try:
-        props = df['peptide'].apply(calculate_physchem_properties).apply(pd.Series)
-    except Exception:
-        # Se falhar no apply (ex: dados corrompidos), retorna o original
-        return df
-    
-    # Se o resultado for uma Series (1 linha apenas), converte para DataFrame
-    if isinstance(props, pd.Series):
-        props = props.to_frame().T
-        
-    # Remove colunas duplicadas antes de concatenar
-    cols_to_remove = [c for c in props.columns if c in df.columns]
-    if cols_to_remove:
-        df = df.drop(columns=cols_to_remove)
-    
-    # Concatena propriedades
-    df_result = pd.concat([df.reset_index(drop=True), props.reset_index(drop=True)], axis=1)
-    
-    return df_result
         return df_result
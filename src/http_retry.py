@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+"""
+Política de retentativas HTTP compartilhada pelos clientes de API
+(src/api_client.py e api_client.py na raiz).
+"""
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Respostas repetidas: rate limiting (429) e erros transitórios do servidor
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+
+def retrying_adapter(max_retries: int, pool_maxsize: int = 10,
+                     pool_connections: int = 10) -> HTTPAdapter:
+    """
+    Cria um HTTPAdapter com backoff exponencial para RETRY_STATUS_CODES e
+    falhas de conexão.
+
+    Args:
+        max_retries: Tentativas extras por requisição
+        pool_maxsize: Conexões mantidas por host
+        pool_connections: Número de pools (hosts) mantidos
+
+    Returns:
+        Adapter pronto para ser montado em uma requests.Session
+    """
+    retry = Retry(
+        total=max_retries,
+        backoff_factor=0.5,
+        status_forcelist=RETRY_STATUS_CODES,
+        allowed_methods=None,  # POST do IEDB também é repetido
+        respect_retry_after_header=True
+    )
+    return HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize,
+                       max_retries=retry)
+
+
+def mount_adapter(session: requests.Session, adapter: HTTPAdapter) -> None:
+    """Monta o adapter para http:// e https:// na sessão."""
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
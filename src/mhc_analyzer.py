@@ -1,6 +1,6 @@
+import numpy as np
 import pandas as pd
 import logging
-from concurrent.futures import ThreadPoolExecutor, as_completed
 
 logger = logging.getLogger(__name__)
 
@@ -8,31 +8,45 @@ class MHCAnalyzer:
     def __init__(self, predictor):
         self.predictor = predictor
 
+    @staticmethod
+    def _sliding_peptides(seq, peptide_lengths):
+        """
+        Todos os k-meros da sequência para cada comprimento, em ordem.
+        
+        Cada comprimento é uma visão (n_janelas, k) sobre os bytes da sequência,
+        convertida de uma vez em strings pelo dtype de tamanho fixo 'S{k}'.
+        Sequências com caracteres não-ASCII usam o fatiamento simples.
+        """
+        seq = str(seq)
+        if not seq.isascii():
+            return [seq[i:i + length] for length in peptide_lengths if length > 0
+                    for i in range(len(seq) - length + 1)]
+        arr = np.frombuffer(seq.encode('ascii'), dtype=np.uint8)
+        kmers = []
+        for length in peptide_lengths:
+            if 0 < length <= len(arr):
+                windows = np.lib.stride_tricks.sliding_window_view(arr, length)
+                kmers.append(np.frombuffer(windows.tobytes(), dtype=f'S{length}').astype(str))
+        return np.concatenate(kmers).tolist() if kmers else []
+
     def predict_mhci_epitopes(self, sequences, alleles, peptide_lengths):
         """Prediz epítopos MHC-I para uma lista de sequências."""
         all_results = []
         try:
             for header, seq in sequences:
-                # Gerar peptídeos para cada comprimento
-                peptides = []
-                for length in peptide_lengths:
-                    for i in range(len(seq) - length + 1):
-                        peptides.append(str(seq[i:i+length]))
-                # Fazer a predição em lotes para melhor performance
+                # Gerar peptídeos para cada comprimento (sem repetições, na ordem de ocorrência)
+                peptides = list(dict.fromkeys(self._sliding_peptides(seq, peptide_lengths)))
+                # Uma única predição por sequência: cada alelo vira uma "amostra"
+                # própria, com uma linha por (peptídeo, alelo)
                 if peptides:
-                    # Usar ThreadPoolExecutor para paralelizar as predições
-                    with ThreadPoolExecutor(max_workers=4) as executor:
-                        futures = []
-                        for allele in alleles:
-                            futures.append(executor.submit(self.predictor.predict, peptides, alleles=[allele]))
-                        for future in as_completed(futures):
-                            result = future.result()
-                            if not result.empty:
-                                all_results.append({
-                                    'header': header,
-                                    'allele': allele,
-                                    'predictions': result
-                                })
+                    result = self.predictor.predict(
+                        peptides, alleles={allele: [allele] for allele in alleles}
+                    ).rename(columns={'sample_name': 'allele'})
+                    if not result.empty:
+                        all_results.append({
+                            'header': header,
+                            'predictions': result
+                        })
             logger.info(f"Total de resultados MHC-I: {len(all_results)}")
         except Exception as e:
             logger.error(f"Erro durante a predição MHC-I: {e}")
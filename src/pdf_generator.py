@@ -4,10 +4,13 @@ Módulo de geração de relatórios PDF profissionais.
 Usa fpdf2 para criar relatórios com gráficos e tabelas formatadas.
 """
 
+import io
 import logging
 import os
-import tempfile
-from typing import Optional
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+import numbers
+import numpy as np
 import pandas as pd
 from datetime import datetime
 from fpdf import FPDF
@@ -20,44 +23,190 @@ try:
     import matplotlib
     matplotlib.use('Agg')  # Backend não-interativo
     import matplotlib.pyplot as plt
+    from matplotlib.figure import Figure
     MATPLOTLIB_AVAILABLE = True
 except ImportError:
     MATPLOTLIB_AVAILABLE = False
     logger.warning("Matplotlib não disponível. Gráficos não serão incluídos no PDF.")
 
 
+# Tenta importar ReportLab (opcional) para o backend de PDF usado em lotes
+try:
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.units import mm
+    from reportlab.lib.utils import ImageReader
+    from reportlab.pdfgen import canvas
+    REPORTLAB_AVAILABLE = True
+except ImportError:
+    REPORTLAB_AVAILABLE = False
+
+# Cabeçalhos traduzidos e larguras (mm) das colunas da tabela de afinidade
+HEADER_MAP = {
+    'peptide': 'Peptideo',
+    'affinity_nm': 'Afinidade (nM)',
+    'iedb_affinity_nm': 'Afinidade IEDB (nM)',
+    'mhc_score': 'Score MHC',
+    'iedb_immunogenicity': 'Imunogenicidade',
+    'percentile_rank': 'Rank %'
+}
+TABLE_COL_WIDTHS = [50, 30, 30, 25, 25]
+
+
+def _report_capabilities(df: pd.DataFrame) -> Dict[str, Any]:
+    """
+    Levanta uma única vez quais colunas opcionais o DataFrame possui.
+    
+    ``affinity_col`` é a primeira coluna de afinidade com algum valor;
+    ``table_affinity_col`` é a primeira apenas presente (a tabela a exibe
+    mesmo vazia, como N/A).
+    """
+    columns = set(df.columns)
+    affinity_cols = [col for col in ('affinity_nm', 'iedb_affinity_nm', 'affinity')
+                     if col in columns]
+    return {
+        'affinity_col': next((col for col in affinity_cols if df[col].notna().any()), None),
+        'table_affinity_col': affinity_cols[0] if affinity_cols else None,
+        'has_mhc_score': 'mhc_score' in columns,
+        'has_percentile_rank': 'percentile_rank' in columns,
+        'has_iedb_imm': 'iedb_immunogenicity' in columns,
+        'has_length': 'length' in columns,
+    }
+
+
+def _table_columns(caps: Dict[str, Any]) -> Optional[List[str]]:
+    """Colunas exibidas na tabela de afinidade (None se não há coluna de afinidade)."""
+    affinity_col = caps['table_affinity_col']
+    if affinity_col is None:
+        return None
+    
+    display_cols = ['peptide', affinity_col]
+    if caps['has_mhc_score']:
+        display_cols.append('mhc_score')
+    if caps['has_iedb_imm']:
+        display_cols.append('iedb_immunogenicity')
+    if caps['has_percentile_rank']:
+        display_cols.append('percentile_rank')
+    return display_cols
+
+
+def _summary_text(total_peptides: int, valid_peptides: int,
+                  top_affinity: float, avg_affinity: float) -> str:
+    """Texto da seção de resumo executivo."""
+    summary_text = f"""
+Total de peptideos analisados: {total_peptides}
+Peptideos validos apos validacao: {valid_peptides}
+Taxa de validacao: {(valid_peptides/total_peptides*100):.1f}%
+
+Melhor afinidade encontrada: {top_affinity:.2f} nM
+Afinidade media: {avg_affinity:.2f} nM
+
+Criterios de validacao aplicados:
+• Sequencias contendo apenas aminoacidos canonicos (20 AA padrao)
+• Tamanho entre 8-14 residuos (compativel com MHC-I)
+• Remocao de duplicatas
+        """
+    return summary_text.strip()
+
+
+def _statistics_lines(df: pd.DataFrame, caps: Dict[str, Any]) -> List[str]:
+    """Linhas da seção de estatísticas descritivas (vazia se não há dados)."""
+    stats_text = []
+    
+    aff_col = caps['affinity_col']
+    if aff_col in ('affinity_nm', 'iedb_affinity_nm'):
+        aff_data = df[aff_col].dropna()
+        stats_text.append(f"Afinidade (nM):")
+        stats_text.append(f"  - Minima: {aff_data.min():.2f}")
+        stats_text.append(f"  - Maxima: {aff_data.max():.2f}")
+        stats_text.append(f"  - Media: {aff_data.mean():.2f}")
+        stats_text.append(f"  - Mediana: {aff_data.median():.2f}")
+        stats_text.append(f"  - Desvio Padrao: {aff_data.std():.2f}")
+        stats_text.append("")
+    
+    if caps['has_length']:
+        len_data = df['length']
+        stats_text.append(f"Tamanho dos peptideos:")
+        stats_text.append(f"  - Minimo: {len_data.min()} residuos")
+        stats_text.append(f"  - Maximo: {len_data.max()} residuos")
+        stats_text.append(f"  - Media: {len_data.mean():.1f} residuos")
+    
+    return stats_text
+
+
+def _format_cell(value, col: str) -> str:
+    """Formata um valor (não nulo) de célula da tabela de afinidade."""
+    if isinstance(value, numbers.Real):  # inclui escalares NumPy (float32, int64)
+        col_lower = col.lower()
+        if 'affinity' not in col_lower and ('score' in col_lower or 'rank' in col_lower):
+            return f"{value:.3f}"
+        return f"{value:.2f}"
+    return str(value)[:15]
+
+
+def _format_column(values: pd.Series, col: str) -> list:
+    """
+    Formata uma coluna inteira da tabela de afinidade.
+    
+    A máscara de nulos é calculada uma vez para a coluna (nulos viram '-').
+    Colunas numéricas são formatadas de uma vez com np.char.mod; as demais
+    usam _format_cell valor a valor.
+    """
+    null_mask = values.isna().to_numpy()
+    if pd.api.types.is_numeric_dtype(values):
+        col_lower = col.lower()
+        fmt = '%.3f' if 'affinity' not in col_lower and ('score' in col_lower or 'rank' in col_lower) else '%.2f'
+        arr = values.to_numpy(dtype=float, na_value=np.nan)
+        return np.where(null_mask, '-', np.char.mod(fmt, np.nan_to_num(arr))).tolist()
+    return ['-' if is_null else _format_cell(value, col)
+            for value, is_null in zip(values.to_numpy(), null_mask)]
+
+
 class PDFGenerator:
     """Classe para geração de relatórios PDF profissionais."""
     
     def __init__(self):
         """Inicializa gerador de PDF."""
+        # Figura do gráfico de afinidade, criada na primeira vez e reutilizada
+        self._chart_fig = None
         logger.info("PDFGenerator inicializado")
     
-    def _create_affinity_chart_image(self, df: pd.DataFrame, max_peptides: int = 20) -> Optional[str]:
+    def _create_affinity_chart_image(self, df: pd.DataFrame, max_peptides: int = 20,
+                                     caps: Optional[Dict[str, Any]] = None) -> Optional[io.BytesIO]:
         """
-        Cria gráfico de afinidade e salva como imagem temporária.
+        Cria gráfico de afinidade como PNG em memória.
         
         Args:
             df: DataFrame com resultados
             max_peptides: Número máximo de peptídeos para exibir
+            caps: Capacidades do DataFrame (ver _report_capabilities)
             
         Returns:
-            Caminho da imagem temporária ou None
+            Buffer com a imagem PNG (posicionado no início) ou None
         """
         if not MATPLOTLIB_AVAILABLE:
             return None
         
-        if 'affinity_nm' not in df.columns or df['affinity_nm'].isna().all():
+        if caps is None:
+            caps = _report_capabilities(df)
+        # affinity_nm é a primeira candidata, então só é a escolhida se tiver valores
+        if caps['affinity_col'] != 'affinity_nm':
             return None
         
         try:
-            df_plot = df.head(max_peptides).copy()
-            df_plot = df_plot.sort_values('affinity_nm', ascending=True)
+            # sort_values já retorna um novo frame; não precisa de copy()
+            df_plot = df.head(max_peptides).sort_values('affinity_nm', ascending=True)
             
-            fig, ax = plt.subplots(figsize=(10, 6))
+            # Figura fora do pyplot: criada uma vez por gerador e limpa a cada chamada
+            if self._chart_fig is None:
+                self._chart_fig = Figure(figsize=(10, 6))
+            fig = self._chart_fig
+            fig.clear()
+            ax = fig.add_subplot()
             
-            colors = ['#27AE60' if x < 50 else '#F39C12' if x < 500 else '#E74C3C' 
-                      for x in df_plot['affinity_nm']]
+            # Cor por faixa de afinidade: forte (<50), intermediária (<500), fraca
+            vals = df_plot['affinity_nm'].to_numpy()
+            colors = np.select([vals < 50, vals < 500], ['#27AE60', '#F39C12'],
+                               default='#E74C3C').tolist()
             
             bars = ax.barh(range(len(df_plot)), df_plot['affinity_nm'], color=colors)
             ax.set_yticks(range(len(df_plot)))
@@ -68,13 +217,13 @@ class PDFGenerator:
             ax.legend()
             ax.grid(axis='x', alpha=0.3)
             
-            plt.tight_layout()
+            fig.tight_layout()
             
-            temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.png')
-            plt.savefig(temp_file.name, dpi=150, bbox_inches='tight')
-            plt.close()
+            buf = io.BytesIO()
+            fig.savefig(buf, format='png', dpi=150, bbox_inches='tight')
+            buf.seek(0)
             
-            return temp_file.name
+            return buf
         except Exception as e:
             logger.warning(f"Erro ao criar gráfico: {e}")
             return None
@@ -83,7 +232,8 @@ class PDFGenerator:
                        total_peptides: Optional[int] = None,
                        include_statistics: bool = True,
                        max_table_rows: int = 50,
-                       allele: str = "HLA-A*02:01") -> str:
+                       allele: str = "HLA-A*02:01",
+                       backend: str = 'fpdf') -> str:
         """
         Gera relatório PDF completo com gráficos.
         
@@ -94,32 +244,31 @@ class PDFGenerator:
             include_statistics: Se True, inclui seção de estatísticas
             max_table_rows: Número máximo de linhas na tabela
             allele: Alelo HLA utilizado
+            backend: 'fpdf' (padrão) ou 'reportlab' (canvas de menor custo,
+                indicado para geração em lote)
             
         Returns:
             Caminho do arquivo gerado
         """
         if 'peptide' not in df.columns:
             raise ValueError("DataFrame deve conter coluna 'peptide'")
+        if backend not in ('fpdf', 'reportlab'):
+            raise ValueError(f"Backend de PDF desconhecido: {backend}")
+        if backend == 'reportlab' and not REPORTLAB_AVAILABLE:
+            logger.warning("ReportLab não disponível. Usando fpdf para o relatório.")
+            backend = 'fpdf'
         
         try:
             logger.info(f"Gerando relatório PDF: {output_path}")
             
-            # Cria PDF
-            pdf = PeptideReportPDF()
-            pdf.add_page()
-            
             # Calcula estatísticas
             valid_peptides = len(df)
             if total_peptides is None:
                 total_peptides = valid_peptides
             
             # Determina coluna de afinidade
-            affinity_col = None
-            for col in ['affinity_nm', 'iedb_affinity_nm', 'affinity']:
-                if col in df.columns and not df[col].isna().all():
-                    affinity_col = col
-                    break
-            
+            caps = _report_capabilities(df)
+            affinity_col = caps['affinity_col']
             if affinity_col:
                 top_affinity = df[affinity_col].min()
                 avg_affinity = df[affinity_col].mean()
@@ -127,40 +276,50 @@ class PDFGenerator:
                 top_affinity = 0.0
                 avg_affinity = 0.0
             
-            # Adiciona seções
-            pdf.add_summary_section(total_peptides, valid_peptides, top_affinity, avg_affinity)
-            
-            # Metadados
-            pdf.chapter_title("Parametros da Analise")
             metadata_text = f"""
 Alelo HLA utilizado: {allele}
 Data de geracao: {datetime.now().strftime("%d/%m/%Y %H:%M:%S")}
 Total de peptideos processados: {total_peptides}
 Peptideos validos: {valid_peptides}
             """
+            chart_buf = self._create_affinity_chart_image(df, max_peptides=20, caps=caps)
+            
+            if backend == 'reportlab':
+                _ReportLabReport(output_path).render(
+                    df, caps, _summary_text(total_peptides, valid_peptides, top_affinity, avg_affinity),
+                    metadata_text.strip(), chart_buf, include_statistics, max_table_rows)
+                logger.info(f"Relatório PDF gerado com sucesso: {output_path}")
+                return output_path
+            
+            # Cria PDF
+            pdf = PeptideReportPDF()
+            pdf.add_page()
+            
+            # Adiciona seções
+            pdf.add_summary_section(total_peptides, valid_peptides, top_affinity, avg_affinity)
+            
+            # Metadados
+            pdf.chapter_title("Parametros da Analise")
             pdf.add_text(metadata_text.strip(), font_size=10)
             
             # Gráfico de afinidade
             pdf.add_page()
             pdf.chapter_title("Grafico de Afinidade")
-            chart_path = self._create_affinity_chart_image(df, max_peptides=20)
-            if chart_path:
+            if chart_buf:
                 try:
-                    pdf.image(chart_path, x=20, w=170)
+                    pdf.image(chart_buf, x=20, w=170)
                     pdf.ln(5)
-                    # Remove arquivo temporário
-                    os.unlink(chart_path)
                 except Exception as e:
                     logger.warning(f"Erro ao adicionar gráfico ao PDF: {e}")
             
             # Tabela de afinidade
             pdf.add_page()
-            pdf.add_affinity_table(df, max_rows=max_table_rows)
+            pdf.add_affinity_table(df, caps, max_rows=max_table_rows)
             
             # Estatísticas (se solicitado)
             if include_statistics:
                 pdf.add_page()
-                pdf.add_statistics_section(df)
+                pdf.add_statistics_section(df, caps)
             
             # Salva PDF
             pdf.output(output_path)
@@ -170,6 +329,38 @@ Peptideos validos: {valid_peptides}
         except Exception as e:
             logger.error(f"Erro ao gerar PDF: {e}")
             raise
+    
+    def generate_reports_batch(self, tasks: List[Tuple[pd.DataFrame, str, Dict[str, Any]]],
+                               max_workers: Optional[int] = None) -> List[str]:
+        """
+        Gera vários relatórios PDF em paralelo, um por processo.
+        
+        Processos em vez de threads: a geração é CPU-bound (rasterização do
+        matplotlib e codificação do fpdf) e o matplotlib não é thread-safe.
+        
+        Args:
+            tasks: Lista de (df, output_path, kwargs de generate_report)
+            max_workers: Número de processos (None = número de CPUs)
+            
+        Returns:
+            Caminhos dos arquivos gerados, na ordem de ``tasks``
+        """
+        if not tasks:
+            return []
+        
+        max_workers = min(max_workers or os.cpu_count() or 1, len(tasks))
+        if max_workers <= 1:
+            return [_generate_one(task) for task in tasks]
+        
+        logger.info(f"Gerando {len(tasks)} relatórios PDF em {max_workers} processos")
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(_generate_one, tasks))
+
+
+def _generate_one(task: Tuple[pd.DataFrame, str, Dict[str, Any]]) -> str:
+    """Gera um relatório em um processo worker (task = (df, output_path, kwargs))."""
+    df, output_path, kwargs = task
+    return PDFGenerator().generate_report(df, output_path, **kwargs)
 
 
 class PeptideReportPDF(FPDF):
@@ -219,80 +410,39 @@ class PeptideReportPDF(FPDF):
                            top_affinity: float, avg_affinity: float):
         """Adiciona seção de resumo executivo."""
         self.chapter_title("Resumo Executivo")
-        
-        summary_text = f"""
-Total de peptideos analisados: {total_peptides}
-Peptideos validos apos validacao: {valid_peptides}
-Taxa de validacao: {(valid_peptides/total_peptides*100):.1f}%
-
-Melhor afinidade encontrada: {top_affinity:.2f} nM
-Afinidade media: {avg_affinity:.2f} nM
-
-Criterios de validacao aplicados:
-• Sequencias contendo apenas aminoacidos canonicos (20 AA padrao)
-• Tamanho entre 8-14 residuos (compativel com MHC-I)
-• Remocao de duplicatas
-        """
-        
-        self.add_text(summary_text.strip(), font_size=10)
+        self.add_text(_summary_text(total_peptides, valid_peptides, top_affinity, avg_affinity),
+                      font_size=10)
         self.ln(5)
     
-    def add_affinity_table(self, df: pd.DataFrame, max_rows: int = 50):
+    def add_affinity_table(self, df: pd.DataFrame, caps: Optional[Dict[str, Any]] = None,
+                           max_rows: int = 50):
         """Adiciona tabela de afinidade."""
         self.chapter_title("Tabela de Afinidade - Top Candidatos")
         
-        # Determina coluna de afinidade
-        if 'affinity_nm' in df.columns:
-            affinity_col = 'affinity_nm'
-        elif 'iedb_affinity_nm' in df.columns:
-            affinity_col = 'iedb_affinity_nm'
-        elif 'affinity' in df.columns:
-            affinity_col = 'affinity'
-        else:
+        if caps is None:
+            caps = _report_capabilities(df)
+        display_cols = _table_columns(caps)
+        if display_cols is None:
             self.add_text("AVISO: Coluna de afinidade nao encontrada.", font_size=10)
             return
         
-        df_top = df.head(max_rows).copy()
-        
-        # Colunas para exibir
-        display_cols = ['peptide']
-        if affinity_col in df_top.columns:
-            display_cols.append(affinity_col)
-        if 'mhc_score' in df_top.columns:
-            display_cols.append('mhc_score')
-        if 'iedb_immunogenicity' in df_top.columns:
-            display_cols.append('iedb_immunogenicity')
-        if 'percentile_rank' in df_top.columns:
-            display_cols.append('percentile_rank')
-        
-        df_display = df_top[display_cols].copy()
+        df_display = df.head(max_rows)[display_cols]
         
         # Cabeçalho
         self.set_font('Helvetica', 'B', 9)
         self.set_fill_color(44, 62, 80)
         self.set_text_color(255, 255, 255)
         
-        col_widths = [50, 30, 30, 25, 25]
         headers = list(df_display.columns)
-        col_widths = col_widths[:len(headers)]
+        col_widths = TABLE_COL_WIDTHS[:len(headers)]
         total_width = sum(col_widths)
         x_start = (210 - total_width) / 2
-        x = x_start
-        
-        header_map = {
-            'peptide': 'Peptideo',
-            'affinity_nm': 'Afinidade (nM)',
-            'iedb_affinity_nm': 'Afinidade IEDB (nM)',
-            'mhc_score': 'Score MHC',
-            'iedb_immunogenicity': 'Imunogenicidade',
-            'percentile_rank': 'Rank %'
-        }
         
+        # cell() com ln=0 avança o cursor para a próxima coluna: basta posicionar
+        # x uma vez por linha
+        self.set_x(x_start)
         for i, header in enumerate(headers):
-            header_pt = header_map.get(header, header)
-            self.set_xy(x, self.get_y())
-            self.cell(col_widths[i], 7, header_pt[:20], 1, 0, 'C', True)
-            x += col_widths[i]
+            self.cell(col_widths[i], 7, HEADER_MAP.get(header, header)[:20], 1, 0, 'C', True)
         
         self.ln(7)
         
@@ -301,80 +451,191 @@ Criterios de validacao aplicados:
         self.set_text_color(0, 0, 0)
         self.set_fill_color(245, 245, 245)
         
+        # Textos das células formatados por coluna, antes do laço de desenho
+        formatted = [_format_column(df_display[col], col) for col in headers]
+        
         fill = False
-        for idx, row in df_display.iterrows():
+        for row_texts in zip(*formatted):
             if self.get_y() > 270:
                 self.add_page()
-                x = x_start
                 self.set_font('Helvetica', 'B', 9)
                 self.set_fill_color(44, 62, 80)
                 self.set_text_color(255, 255, 255)
+                self.set_x(x_start)
                 for i, header in enumerate(headers):
-                    header_pt = header_map.get(header, header)
-                    self.set_xy(x, self.get_y())
-                    self.cell(col_widths[i], 7, header_pt[:20], 1, 0, 'C', True)
-                    x += col_widths[i]
+                    self.cell(col_widths[i], 7, HEADER_MAP.get(header, header)[:20], 1, 0, 'C', True)
                 self.ln(7)
                 self.set_font('Helvetica', '', 8)
                 self.set_text_color(0, 0, 0)
                 self.set_fill_color(245, 245, 245)
             
-            x = x_start
-            for i, col in enumerate(headers):
-                value = row[col]
-                
-                if pd.isna(value):
-                    text = '-'
-                elif isinstance(value, (int, float)):
-                    if 'affinity' in col.lower():
-                        text = f"{value:.2f}"
-                    elif 'score' in col.lower() or 'rank' in col.lower():
-                        text = f"{value:.3f}"
-                    else:
-                        text = f"{value:.2f}"
-                else:
-                    text = str(value)[:15]
-                
-                self.set_xy(x, self.get_y())
+            self.set_x(x_start)
+            for i, text in enumerate(row_texts):
                 self.cell(col_widths[i], 6, text, 1, 0, 'C', fill)
-                x += col_widths[i]
             
             self.ln(6)
             fill = not fill
         
         self.ln(5)
     
-    def add_statistics_section(self, df: pd.DataFrame):
+    def add_statistics_section(self, df: pd.DataFrame, caps: Optional[Dict[str, Any]] = None):
         """Adiciona seção de estatísticas."""
         self.chapter_title("Estatisticas Descritivas")
         
-        stats_text = []
-        
-        if 'affinity_nm' in df.columns:
-            aff_col = 'affinity_nm'
-        elif 'iedb_affinity_nm' in df.columns:
-            aff_col = 'iedb_affinity_nm'
-        else:
-            aff_col = None
-        
-        if aff_col and not df[aff_col].isna().all():
-            aff_data = df[aff_col].dropna()
-            stats_text.append(f"Afinidade (nM):")
-            stats_text.append(f"  - Minima: {aff_data.min():.2f}")
-            stats_text.append(f"  - Maxima: {aff_data.max():.2f}")
-            stats_text.append(f"  - Media: {aff_data.mean():.2f}")
-            stats_text.append(f"  - Mediana: {aff_data.median():.2f}")
-            stats_text.append(f"  - Desvio Padrao: {aff_data.std():.2f}")
-            stats_text.append("")
-        
-        if 'length' in df.columns:
-            len_data = df['length']
-            stats_text.append(f"Tamanho dos peptideos:")
-            stats_text.append(f"  - Minimo: {len_data.min()} residuos")
-            stats_text.append(f"  - Maximo: {len_data.max()} residuos")
-            stats_text.append(f"  - Media: {len_data.mean():.1f} residuos")
-        
+        if caps is None:
+            caps = _report_capabilities(df)
+        stats_text = _statistics_lines(df, caps)
         if stats_text:
             self.add_text("\n".join(stats_text), font_size=10)
         else:
             self.add_text("Estatisticas nao disponiveis.", font_size=10)
+
+
+class _ReportLabReport:
+    """
+    Renderização do relatório direto no canvas do ReportLab.
+    
+    Mesmo layout do PeptideReportPDF, mas a tabela é desenhada por página com
+    um TextObject por coluna e um único ``grid`` para as bordas, em vez de
+    uma chamada cell() por célula.
+    """
+    
+    def __init__(self, output_path: str):
+        self.canvas = canvas.Canvas(output_path, pagesize=A4)
+        self.width, self.height = A4
+        self.MARGIN = 15 * mm
+        self.ROW_HEIGHT = 6 * mm
+        self.HEADER_HEIGHT = 7 * mm
+        self.page = 0
+        self.date_text = f'Gerado em: {datetime.now().strftime("%d/%m/%Y %H:%M")}'
+    
+    def new_page(self) -> float:
+        """Fecha a página atual, desenha cabeçalho/rodapé e retorna o topo útil."""
+        c = self.canvas
+        if self.page:
+            c.showPage()
+        self.page += 1
+        
+        top = self.height - self.MARGIN
+        c.setFillColorRGB(0, 0, 0)
+        c.setFont('Helvetica-Bold', 16)
+        c.drawCentredString(self.width / 2, top - 7 * mm, 'Relatorio de Analise de Peptideos')
+        c.setFillColorRGB(128 / 255, 128 / 255, 128 / 255)
+        c.setFont('Helvetica', 10)
+        c.drawCentredString(self.width / 2, top - 13 * mm, self.date_text)
+        c.setFont('Helvetica-Oblique', 8)
+        c.drawCentredString(self.width / 2, 10 * mm, f'Pagina {self.page}')
+        return top - 20 * mm
+    
+    def chapter_title(self, y: float, title: str) -> float:
+        c = self.canvas
+        c.setFillColorRGB(44 / 255, 62 / 255, 80 / 255)
+        c.setFont('Helvetica-Bold', 14)
+        c.drawString(self.MARGIN, y - 7 * mm, title)
+        c.setStrokeColorRGB(44 / 255, 62 / 255, 80 / 255)
+        c.line(self.MARGIN, y - 12 * mm, self.width - self.MARGIN, y - 12 * mm)
+        return y - 17 * mm
+    
+    def add_text(self, y: float, text: str, font_size: int = 10) -> float:
+        c = self.canvas
+        c.setFillColorRGB(0, 0, 0)
+        text_obj = c.beginText(self.MARGIN, y - 4 * mm)
+        text_obj.setFont('Helvetica', font_size)
+        text_obj.setLeading(5 * mm)
+        text_obj.textLines(text)
+        c.drawText(text_obj)
+        return text_obj.getY() - 2 * mm
+    
+    def add_image(self, y: float, image_buf: io.BytesIO) -> float:
+        image = ImageReader(image_buf)
+        img_width, img_height = image.getSize()
+        width = 170 * mm
+        height = width * img_height / img_width
+        self.canvas.drawImage(image, 20 * mm, y - height, width=width, height=height)
+        return y - height - 5 * mm
+    
+    def add_affinity_table(self, y: float, df: pd.DataFrame, caps: Dict[str, Any],
+                           max_rows: int) -> float:
+        y = self.chapter_title(y, f"Top {max_rows} Peptideos por Afinidade")
+        
+        display_cols = _table_columns(caps)
+        if display_cols is None:
+            return self.add_text(y, "AVISO: Coluna de afinidade nao encontrada.")
+        
+        df_display = df.head(max_rows)[display_cols]
+        col_widths = [w * mm for w in TABLE_COL_WIDTHS[:len(display_cols)]]
+        x_start = (self.width - sum(col_widths)) / 2
+        xs = [x_start]
+        for w in col_widths:
+            xs.append(xs[-1] + w)
+        
+        formatted = [_format_column(df_display[col], col) for col in display_cols]
+        n_rows = len(df_display)
+        start = 0
+        while True:
+            n_fit = max(int((y - 27 * mm - self.HEADER_HEIGHT) // self.ROW_HEIGHT), 1)
+            stop = min(start + n_fit, n_rows)
+            self._draw_table_page(y, xs, display_cols, formatted, start, stop)
+            if stop >= n_rows:
+                return y - self.HEADER_HEIGHT - (stop - start) * self.ROW_HEIGHT - 5 * mm
+            start = stop
+            y = self.new_page()
+    
+    def _draw_table_page(self, y: float, xs: List[float], display_cols: List[str],
+                         formatted: List[list], start: int, stop: int):
+        """Desenha o cabeçalho e as linhas [start, stop) da tabela a partir de y."""
+        c = self.canvas
+        table_width = xs[-1] - xs[0]
+        body_top = y - self.HEADER_HEIGHT
+        
+        # Fundo do cabeçalho e das linhas alternadas
+        c.setFillColorRGB(44 / 255, 62 / 255, 80 / 255)
+        c.rect(xs[0], body_top, table_width, self.HEADER_HEIGHT, stroke=0, fill=1)
+        c.setFillColorRGB(245 / 255, 245 / 255, 245 / 255)
+        for i in range(1 - start % 2, stop - start, 2):
+            c.rect(xs[0], body_top - (i + 1) * self.ROW_HEIGHT, table_width,
+                   self.ROW_HEIGHT, stroke=0, fill=1)
+        
+        # Textos do cabeçalho
+        c.setFillColorRGB(1, 1, 1)
+        c.setFont('Helvetica-Bold', 9)
+        for x0, x1, col in zip(xs, xs[1:], display_cols):
+            c.drawCentredString((x0 + x1) / 2, y - 5 * mm, HEADER_MAP.get(col, col)[:20])
+        
+        # Um TextObject por coluna
+        c.setFillColorRGB(0, 0, 0)
+        for x0, texts in zip(xs, formatted):
+            text_obj = c.beginText(x0 + 1.5 * mm, body_top - 4.2 * mm)
+            text_obj.setFont('Helvetica', 8)
+            text_obj.setLeading(self.ROW_HEIGHT)
+            text_obj.textLines(texts[start:stop])
+            c.drawText(text_obj)
+        
+        # Bordas de todas as células em uma única chamada
+        ys = [y] + [body_top - i * self.ROW_HEIGHT for i in range(stop - start + 1)]
+        c.setStrokeColorRGB(0, 0, 0)
+        c.grid(xs, ys)
+    
+    def render(self, df: pd.DataFrame, caps: Dict[str, Any], summary_text: str, metadata_text: str,
+               chart_buf: Optional[io.BytesIO], include_statistics: bool, max_table_rows: int):
+        y = self.new_page()
+        y = self.chapter_title(y, "Resumo Executivo")
+        y = self.add_text(y, summary_text)
+        y = self.chapter_title(y - 5 * mm, "Parametros da Analise")
+        self.add_text(y, metadata_text)
+        
+        y = self.chapter_title(self.new_page(), "Grafico de Afinidade")
+        if chart_buf:
+            try:
+                self.add_image(y, chart_buf)
+            except Exception as e:
+                logger.warning(f"Erro ao adicionar gráfico ao PDF: {e}")
+        
+        self.add_affinity_table(self.new_page(), df, caps, max_table_rows)
+        
+        if include_statistics:
+            y = self.chapter_title(self.new_page(), "Estatisticas Descritivas")
+            stats_text = _statistics_lines(df, caps)
+            self.add_text(y, stats_text if stats_text else "Estatisticas nao disponiveis.")
+        
+        self.canvas.save()
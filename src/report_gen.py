@@ -1,5 +1,4 @@
 from fpdf import FPDF
-import pandas as pd
 import logging
 from datetime import datetime
 import tempfile
@@ -7,54 +6,103 @@ import os
 
 logger = logging.getLogger(__name__)
 
+# Mensagens fixas das seções sem resultados
+_EMPTY_FASTA = "Nenhuma sequência analisada."
+_EMPTY_MHCI = "Nenhum epítopo MHC-I encontrado com os thresholds fornecidos."
+_NO_MHCI = "Nenhum resultado MHC-I disponível."
+_NO_MHCII = "Nenhum resultado MHC-II disponível."
+
 class PDFGenerator(FPDF):
     def __init__(self):
         super().__init__()
         self.set_auto_page_break(auto=True, margin=15)
 
+    def _use_font(self, style, size):
+        # Só chama set_font quando a fonte muda, comparando com o estado do
+        # próprio fpdf (que o add_page restaura sozinho). Helvetica direto:
+        # 'Arial' é só um alias e passa pelo aviso de substituição a cada troca
+        if self.font_family != 'helvetica' or self.font_style != style or self.font_size_pt != size:
+            self.set_font('Helvetica', style, size)
+
     def header(self):
-        self.set_font('Arial', 'B', 12)
+        self._use_font('B', 12)
         self.cell(0, 10, 'Relatório de Análise de Epítopos Imunológicos', 0, 1, 'C')
 
     def footer(self):
         self.set_y(-15)
-        self.set_font('Arial', 'I', 8)
+        self._use_font('I', 8)
         self.cell(0, 10, f'Página {self.page_no()}', 0, 0, 'C')
 
     def add_title(self, title):
-        self.set_font('Arial', 'B', 16)
+        self._use_font('B', 16)
         self.cell(0, 10, title, 0, 1, 'L')
         self.ln(5)
 
     def add_section_title(self, title):
-        self.set_font('Arial', 'B', 12)
+        self._use_font('B', 12)
         self.cell(0, 10, title, 0, 1, 'L')
         self.ln(2)
 
     def add_text(self, text):
-        self.set_font('Arial', '', 10)
+        self._use_font('', 10)
         self.multi_cell(0, 5, text)
         self.ln(2)
 
     def add_table(self, df):
         # Adiciona uma tabela ao PDF
-        self.set_font('Arial', '', 8)
-        # Cabeçalho
+        # As linhas são desenhadas em blocos do tamanho da página restante
+        # (bordas + textos) com rect/line/text, em vez de um cell() por célula
+        self._use_font('', 8)
+        col_w, row_h = 40, 6
+        x = self.get_x()
+        xs = [x + j * col_w for j in range(len(df.columns) + 1)]
+        # Cabeçalho + dados, sem criar uma Series por linha; os textos são
+        # convertidos coluna a coluna (floats arredondados a 3 casas)
+        columns = []
         for col in df.columns:
-            self.cell(40, 6, col, 1, 0, 'C')
-        self.ln()
-        # Dados
-        for _, row in df.iterrows():
-            for col in df.columns:
-                self.cell(40, 6, str(row[col]), 1, 0, 'C')
-            self.ln()
+            values = df[col]
+            if values.dtype.kind == 'f':
+                values = values.round(3)
+            columns.append(values.to_numpy().astype(str).tolist())
+        rows = [[str(col) for col in df.columns]]
+        rows.extend(zip(*columns))
+        start = 0
+        while start < len(rows):
+            n_fit = int((self.page_break_trigger - self.get_y()) // row_h)
+            if n_fit < 1:
+                self.add_page()
+                continue
+            self._add_table_block(xs, rows[start:start + n_fit], row_h)
+            start += n_fit
         self.ln(5)
 
+    def _add_table_block(self, xs, rows, row_h):
+        # Desenha as linhas que cabem na página atual a partir de get_y()
+        y = self.get_y()
+        col_w = xs[1] - xs[0]
+        height = len(rows) * row_h
+        # Métodos usados por célula ligados a locais fora dos laços
+        line, text_at, string_width = self.line, self.text, self.get_string_width
+        self.rect(xs[0], y, xs[-1] - xs[0], height)
+        for x in xs[1:-1]:
+            line(x, y, x, y + height)
+        for i in range(1, len(rows)):
+            line(xs[0], y + i * row_h, xs[-1], y + i * row_h)
+        # Mesma linha de base que o cell() usa para texto centralizado
+        baseline = y + 0.5 * row_h + 0.3 * self.font_size
+        for texts in rows:
+            for x, text in zip(xs, texts):
+                text_at(x + (col_w - string_width(text)) / 2, baseline, text)
+            baseline += row_h
+        self.set_xy(xs[0], y + height)
+
     def generate_report(self, fasta_data, mhci_results, mhcii_results, alleles_mhci, alleles_mhcii,
                         peptide_lengths_mhci, peptide_lengths_mhcii, ic50_threshold, percentile_threshold):
-        # Criar um arquivo temporário para o PDF
-        temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.pdf')
-        pdf_path = temp_file.name
+        # Retorna o PDF em bytes (ex: para st.download_button); use
+        # generate_report_to_file quando precisar de um arquivo
+        # pandas/numpy só são carregados quando um relatório é de fato gerado
+        import numpy as np
+        import pandas as pd
 
         self.add_page()
 
@@ -64,14 +112,14 @@ class PDFGenerator(FPDF):
 
         # Seção: Parâmetros
         self.add_section_title("Parâmetros da Análise")
-        params_text = f"""
-        Alelos MHC-I: {', '.join(alleles_mhci)}
-        Alelos MHC-II: {', '.join(alleles_mhcii)}
-        Comprimentos dos peptídeos MHC-I: {', '.join(map(str, peptide_lengths_mhci))}
-        Comprimentos dos peptídeos MHC-II: {', '.join(map(str, peptide_lengths_mhcii))}
-        Threshold de IC50: {ic50_threshold} nM
-        Threshold de Percentil: {percentile_threshold}
-        """
+        params_text = "\n".join([
+            f"Alelos MHC-I: {', '.join(alleles_mhci)}",
+            f"Alelos MHC-II: {', '.join(alleles_mhcii)}",
+            f"Comprimentos dos peptídeos MHC-I: {', '.join(map(str, peptide_lengths_mhci))}",
+            f"Comprimentos dos peptídeos MHC-II: {', '.join(map(str, peptide_lengths_mhcii))}",
+            f"Threshold de IC50: {ic50_threshold} nM",
+            f"Threshold de Percentil: {percentile_threshold}",
+        ])
         self.add_text(params_text)
 
         # Seção: Sequências Analisadas
@@ -80,39 +128,68 @@ class PDFGenerator(FPDF):
             fasta_df = pd.DataFrame(fasta_data)
             self.add_table(fasta_df[['id', 'length', 'isoelectric_point', 'gravy']].head())  # Mostrar apenas as primeiras
         else:
-            self.add_text("Nenhuma sequência analisada.")
+            self.add_text(_EMPTY_FASTA)
 
         # Seção: Resultados MHC-I
         self.add_section_title("Resultados MHC-I")
         if mhci_results:
             # Combinar todos os resultados em um DataFrame
-            df_list = []
-            for result in mhci_results:
-                df_list.append(result['predictions'])
-            combined_df = pd.concat(df_list, ignore_index=True)
+            df_list = [result['predictions'] for result in mhci_results]
+            cols = df_list[0].columns
+            if len(df_list) == 1:
+                combined_df = df_list[0]
+            elif all(d.columns.equals(cols) and all(isinstance(t, np.dtype) for t in d.dtypes)
+                     for d in df_list):
+                # Mesmas colunas e só dtypes NumPy: concatena coluna a coluna sem
+                # a consolidação de blocos do pd.concat
+                combined_df = pd.DataFrame({
+                    col: np.concatenate([d[col].to_numpy() for d in df_list])
+                    for col in cols
+                })
+            else:
+                # Colunas diferentes ou dtypes de extensão/categóricos
+                combined_df = pd.concat(df_list, ignore_index=True)
             # Filtrar por threshold
-            filtered_df = combined_df[(combined_df['ic50'] <= ic50_threshold) & (combined_df['percentile'] <= percentile_threshold)]
-            if not filtered_df.empty:
-                self.add_text(f"Total de epítopos preditos (com thresholds): {len(filtered_df)}")
-                # Mostrar os top 20
-                top_df = filtered_df.sort_values(by='ic50').head(20)
+            ic50 = combined_df['ic50'].to_numpy()
+            pct = combined_df['percentile'].to_numpy()
+            mask = (ic50 <= ic50_threshold) & (pct <= percentile_threshold)
+            n_filtered = int(mask.sum())
+            if n_filtered:
+                self.add_text(f"Total de epítopos preditos (com thresholds): {n_filtered}")
+                # Mostrar os top 20 (seleção parcial, sem ordenar tudo)
+                top_df = combined_df.loc[mask].nsmallest(20, 'ic50')
                 self.add_table(top_df[['peptide', 'allele', 'ic50', 'percentile']])
             else:
-                self.add_text("Nenhum epítopo MHC-I encontrado com os thresholds fornecidos.")
+                self.add_text(_EMPTY_MHCI)
         else:
-            self.add_text("Nenhum resultado MHC-I disponível.")
+            self.add_text(_NO_MHCI)
 
         # Seção: Resultados MHC-II
         self.add_section_title("Resultados MHC-II")
         if mhcii_results is not None and not mhcii_results.empty:
             self.add_text(f"Total de epítopos MHC-II preditos: {len(mhcii_results)}")
-            # Mostrar os top 20
-            top_df = mhcii_results.sort_values(by='ic50').head(20)
+            # Mostrar os top 20 (seleção parcial, sem ordenar tudo)
+            top_df = mhcii_results.nsmallest(20, 'ic50')
             self.add_table(top_df[['peptide', 'allele', 'ic50']])
         else:
-            self.add_text("Nenhum resultado MHC-II disponível.")
-
-        # Gerar o PDF
-        self.output(pdf_path)
+            self.add_text(_NO_MHCII)
+
+        # Gerar o PDF em memória
+        pdf_bytes = self.output()
+        if isinstance(pdf_bytes, str):  # PyFPDF antigo devolve str latin-1
+            return pdf_bytes.encode('latin-1')
+        return bytes(pdf_bytes)
+
+    def generate_report_to_file(self, *args, pdf_path=None, **kwargs):
+        # Mesmo relatório de generate_report, gravado de uma vez em pdf_path
+        # (ou em um arquivo temporário); retorna o caminho
+        pdf_bytes = self.generate_report(*args, **kwargs)
+        if pdf_path is None:
+            with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as temp_file:
+                temp_file.write(pdf_bytes)
+            pdf_path = temp_file.name
+        else:
+            with open(pdf_path, 'wb') as f:
+                f.write(pdf_bytes)
         logger.info(f"Relatório gerado: {pdf_path}")
         return pdf_path
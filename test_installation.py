@@ -4,8 +4,17 @@ Script de teste para verificar instalação.
 Execute: python test_installation.py
 """
 
+import importlib.util
 import sys
 
+def _module_available(module: str) -> bool:
+    """Localiza o módulo sem executá-lo (evita o custo de import de streamlit, mhcflurry etc.)."""
+    try:
+        return importlib.util.find_spec(module) is not None
+    except (ImportError, ValueError):
+        return False
+
+
 def test_imports():
     """Testa imports de todos os módulos necessários."""
     modules = {
@@ -28,10 +37,9 @@ def test_imports():
     
     failed = []
     for module, name in modules.items():
-        try:
-            __import__(module)
+        if _module_available(module):
             print(f"✅ {name:20} - OK")
-        except ImportError as e:
+        else:
             print(f"❌ {name:20} - FALTANDO")
             failed.append(name)
     
@@ -62,11 +70,10 @@ def test_imports():
         
         local_failed = []
         for module in local_modules:
-            try:
-                __import__(module)
+            if _module_available(module):
                 print(f"✅ {module:25} - OK")
-            except ImportError as e:
-                print(f"❌ {module:25} - ERRO: {e}")
+            else:
+                print(f"❌ {module:25} - NÃO ENCONTRADO")
                 local_failed.append(module)
         
         if local_failed:
@@ -0,0 +1,146 @@
+import math
+import unittest
+import random
+from collections import Counter
+from Bio import Align
+from Bio.Align import substitution_matrices
+import conservation_analysis
+from conservation_analysis import (calculate_conservation_score, calculate_positional_conservation,
+                                   _encode_sequences)
+from src.conservation import ConservationAnalyzer
+
+AMINO_ACIDS = "ACDEFGHIKLMNPQRSTVWY"
+
+
+def _random_seq(rng, length):
+    return ''.join(rng.choice(AMINO_ACIDS) for _ in range(length))
+
+
+def _expected_scores(peptide, references):
+    # Referência: score do PairwiseAligner local com BLOSUM62 / (2 * len) contra cada referência;
+    # referências sem alinhamento (score 0) são ignoradas, como em align()
+    aligner = Align.PairwiseAligner()
+    aligner.mode = 'local'
+    aligner.substitution_matrix = substitution_matrices.load("BLOSUM62")
+    identities = []
+    for ref in references:
+        alignments = aligner.align(peptide, ref)
+        if alignments:
+            identities.append(alignments[0].score / (len(peptide) * 2))
+    max_identity = max(identities)
+    mean_identity = sum(identities) / len(identities)
+    return {
+        'conservation_score': round(max_identity * 0.6 + mean_identity * 0.4, 4),
+        'max_identity': round(max_identity, 4),
+        'mean_identity': round(mean_identity, 4),
+        'matches': sum(identity > 0.8 for identity in identities)
+    }
+
+
+class TestReferenceConservation(unittest.TestCase):
+    def setUp(self):
+        rng = random.Random(0)
+        self.references = [_random_seq(rng, rng.randint(40, 120)) for _ in range(5)]
+        self.peptides = [_random_seq(rng, rng.randint(8, 11)) for _ in range(20)]
+        # Um peptídeo que ocorre exatamente em uma das referências
+        self.peptides.append(self.references[2][10:19])
+
+    def assertScoresEqual(self, result, expected):
+        for key in ('conservation_score', 'max_identity', 'mean_identity'):
+            self.assertAlmostEqual(result[key], expected[key], places=4)
+        self.assertEqual(result['matches'], expected['matches'])
+
+    def test_matches_pairwise_aligner(self):
+        for peptide in self.peptides:
+            expected = _expected_scores(peptide, self.references)
+            self.assertScoresEqual(calculate_conservation_score(peptide, self.references), expected)
+
+    def test_compiled_kernel_matches_pairwise_aligner(self):
+        if not conservation_analysis.NUMBA_AVAILABLE:
+            self.skipTest("Numba não disponível")
+        encoded = _encode_sequences(self.references)
+        for peptide in self.peptides:
+            expected = _expected_scores(peptide, self.references)
+            self.assertScoresEqual(calculate_conservation_score(peptide, self.references, encoded),
+                                   expected)
+
+    def test_zero_kmer_overlap_aligns_everything(self):
+        for peptide in self.peptides:
+            expected = _expected_scores(peptide, self.references)
+            self.assertScoresEqual(
+                calculate_conservation_score(peptide, self.references, min_kmer_overlap=0),
+                expected)
+
+    def test_reference_without_positive_alignment_is_skipped(self):
+        # W não pontua positivamente contra P nem G na BLOSUM62
+        references = ['PPPPGG', 'WWWWAA']
+        expected = _expected_scores('WWWW', references)
+        self.assertEqual(expected['mean_identity'], expected['max_identity'])
+        results = [calculate_conservation_score('WWWW', references),
+                   calculate_conservation_score('WWWW', references, min_kmer_overlap=0),
+                   ConservationAnalyzer().calculate_conservation_score('WWWW', references)]
+        if conservation_analysis.NUMBA_AVAILABLE:
+            results.append(calculate_conservation_score('WWWW', references,
+                                                        _encode_sequences(references)))
+        for result in results:
+            self.assertScoresEqual(result, expected)
+
+    def test_src_analyzer_matches_pairwise_aligner(self):
+        analyzer = ConservationAnalyzer()
+        batch = analyzer.calculate_conservation_scores(self.peptides, self.references)
+        for peptide, result in zip(self.peptides, batch):
+            expected = _expected_scores(peptide, self.references)
+            self.assertScoresEqual(result, expected)
+            self.assertScoresEqual(analyzer.calculate_conservation_score(peptide, self.references),
+                                   expected)
+
+
+def _naive_positional(peptides):
+    # Referência: Counter por coluna, ignorando gaps do padding
+    max_len = max(len(p) for p in peptides)
+    rows = []
+    for pos in range(max_len):
+        column = [p[pos] for p in peptides if pos < len(p)]
+        if not column:
+            continue
+        counts = Counter(column)
+        entropy = -sum((c / len(column)) * math.log2(c / len(column)) for c in counts.values())
+        rows.append((pos + 1, round(entropy, 4),
+                     round(1 - entropy / 4.32 if entropy > 0 else 1.0, 4),
+                     counts.most_common(1)[0][0]))
+    return rows
+
+
+class TestPositionalConservation(unittest.TestCase):
+    def setUp(self):
+        rng = random.Random(1)
+        self.peptides = [_random_seq(rng, rng.randint(8, 12)) for _ in range(30)]
+        # Posição totalmente conservada e empate no resíduo mais comum
+        self.peptides += ['AAAAAAAA', 'AAAAAAAA', 'ACACACAC']
+
+    def assertMatchesNaive(self, result):
+        expected = _naive_positional(self.peptides)
+        rows = list(result[['position', 'entropy', 'conservation', 'most_common_aa']]
+                    .itertuples(index=False, name=None))
+        self.assertEqual(len(rows), len(expected))
+        for row, exp in zip(rows, expected):
+            self.assertEqual(row[0], exp[0])
+            self.assertAlmostEqual(row[1], exp[1], places=4)
+            self.assertAlmostEqual(row[2], exp[2], places=4)
+            self.assertEqual(row[3], exp[3])
+
+    def test_matches_counter_entropy(self):
+        self.assertMatchesNaive(calculate_positional_conservation(self.peptides))
+
+    def test_src_analyzer_matches_counter_entropy(self):
+        self.assertMatchesNaive(ConservationAnalyzer().calculate_positional_conservation(self.peptides))
+
+    def test_src_shannon_entropy(self):
+        column = list('AACDDDW')
+        counts = Counter(column)
+        expected = -sum((c / 7) * math.log2(c / 7) for c in counts.values())
+        self.assertAlmostEqual(ConservationAnalyzer.calculate_shannon_entropy(column), expected, places=10)
+
+
+if __name__ == '__main__':
+    unittest.main()
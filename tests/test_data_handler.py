@@ -0,0 +1,35 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+from data_handler import min_max_normalize, write_excel
+
+
+class TestWriteExcel(unittest.TestCase):
+    def test_nan_and_inf_cells(self):
+        try:
+            import openpyxl
+        except ImportError:
+            self.skipTest("openpyxl não disponível")
+        df = pd.DataFrame({'score': [1.5, np.inf, -np.inf, np.nan], 'peptide': ['A', 'B', None, 'D']})
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'out.xlsx')
+            write_excel(df, path)
+            rows = [[cell.value for cell in row] for row in openpyxl.load_workbook(path).active.iter_rows()]
+        self.assertEqual(rows, [['score', 'peptide'], [1.5, 'A'], ['inf', 'B'], ['-inf', None], [None, 'D']])
+
+
+class TestMinMaxNormalize(unittest.TestCase):
+    def test_matches_min_max_scaler(self):
+        values = pd.Series([0.2, 0.8, 0.5, np.nan])
+        # NaN conta como 0 antes de normalizar
+        np.testing.assert_allclose(min_max_normalize(values), [0.25, 1.0, 0.625, 0.0], rtol=1e-6)
+
+    def test_constant_column_is_zero(self):
+        np.testing.assert_array_equal(min_max_normalize(pd.Series([0.7])), [0.0])
+        np.testing.assert_array_equal(min_max_normalize(pd.Series([0.3, 0.3, 0.3])), [0.0, 0.0, 0.0])
+
+
+if __name__ == '__main__':
+    unittest.main()
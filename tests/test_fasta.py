@@ -2,13 +2,15 @@ import unittest
 from src.data_handler import FastaProcessor
 import io
 
-class TestFastaProcessor(unittest.TestCase):
-    def test_parse_fasta(self):
-        fasta_content = """>seq1
+# FASTA de teste, já em bytes (compartilhado entre os testes)
+_FASTA_BYTES = b""">seq1
 MSTNGER
 >seq2
 MKLLSI"""
-        uploaded_file = io.BytesIO(fasta_content.encode())
+
+class TestFastaProcessor(unittest.TestCase):
+    def test_parse_fasta(self):
+        uploaded_file = io.BytesIO(_FASTA_BYTES)
         processor = FastaProcessor(uploaded_file)
         sequences = processor.sequences
         self.assertEqual(len(sequences), 2)
@@ -0,0 +1,21 @@
+import unittest
+from src.mhc_analyzer import MHCAnalyzer
+
+
+def _naive_peptides(seq, peptide_lengths):
+    return [seq[i:i + length] for length in peptide_lengths for i in range(len(seq) - length + 1)]
+
+
+class TestSlidingPeptides(unittest.TestCase):
+    def test_matches_slicing(self):
+        for seq in ('MKTIIALSYIFCLVFA', 'MKT', ''):
+            self.assertEqual(MHCAnalyzer._sliding_peptides(seq, [8, 9, 10]),
+                             _naive_peptides(seq, [8, 9, 10]))
+
+    def test_non_ascii_sequence(self):
+        seq = 'MKTIIÁLSYIFCLV'
+        self.assertEqual(MHCAnalyzer._sliding_peptides(seq, [8, 9]), _naive_peptides(seq, [8, 9]))
+
+
+if __name__ == '__main__':
+    unittest.main()
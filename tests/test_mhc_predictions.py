@@ -0,0 +1,33 @@
+import unittest
+import numpy as np
+import pandas as pd
+from mhc_predictions import _best_allele
+
+
+class TestBestAllele(unittest.TestCase):
+    def test_matches_groupby_idxmax(self):
+        rng = np.random.default_rng(0)
+        alleles = ['HLA-A*02:01', 'HLA-B*07:02', 'HLA-C*07:01']
+        n_peptides = 50
+        results = pd.DataFrame({
+            'peptide_num': np.tile(np.arange(n_peptides), len(alleles)),
+            'sample_name': np.repeat(alleles, n_peptides),
+            'presentation_score': rng.random(n_peptides * len(alleles)).round(2),
+            'affinity': rng.random(n_peptides * len(alleles)) * 5000,
+        })
+        # Formato longo do MHCflurry não vem ordenado por peptídeo
+        results = results.sample(frac=1, random_state=0).reset_index(drop=True)
+
+        best_idx, best = _best_allele(results, alleles, n_peptides, ['presentation_score', 'affinity'])
+
+        # Referência: idxmax por peptídeo; empates ficam com o primeiro alelo de `alleles`
+        ordered = results.assign(order=results['sample_name'].map(alleles.index))
+        ordered = ordered.sort_values(['peptide_num', 'order'])
+        expected = ordered.loc[ordered.groupby('peptide_num')['presentation_score'].idxmax()]
+        np.testing.assert_array_equal(best_idx, expected['order'].to_numpy())
+        np.testing.assert_array_equal(best['presentation_score'], expected['presentation_score'].to_numpy())
+        np.testing.assert_array_equal(best['affinity'], expected['affinity'].to_numpy())
+
+
+if __name__ == '__main__':
+    unittest.main()
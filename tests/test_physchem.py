@@ -0,0 +1,48 @@
+import random
+import unittest
+from Bio.SeqUtils.ProtParam import ProteinAnalysis
+from src.data_processor import FastaProcessor
+
+AMINO_ACIDS = "ACDEFGHIKLMNPQRSTVWY"
+
+
+def _expected_properties(peptide):
+    # Referência: ProteinAnalysis do Biopython, com o mesmo arredondamento
+    pa = ProteinAnalysis(peptide)
+    frac = {aa: peptide.count(aa) / len(peptide) for aa in "AVIL"}
+    return {
+        "length": len(peptide),
+        "mw": round(pa.molecular_weight(), 2),
+        "pI": round(pa.isoelectric_point(), 2),
+        "gravy": round(pa.gravy(), 3),
+        "instability_index": round(pa.instability_index(), 2),
+        "aliphatic_index": round(
+            (frac['A'] + 2.9 * frac['V'] + 3.9 * (frac['I'] + frac['L'])) * 100, 2
+        ),
+    }
+
+
+class TestPhyschemBatch(unittest.TestCase):
+    def setUp(self):
+        rng = random.Random(0)
+        self.peptides = [''.join(rng.choice(AMINO_ACIDS) for _ in range(rng.randint(8, 25)))
+                         for _ in range(200)]
+        # Casos extremos de carga para a bisseção do pI
+        self.peptides += ['KKKKKKKKRR', 'DDDDEEEEDE', 'CCYYCCYYHH', 'GGGGGGGGG', 'M']
+
+    def test_matches_protein_analysis(self):
+        table = FastaProcessor.calculate_physchem_batch(self.peptides)
+        for peptide, (_, row) in zip(self.peptides, table.iterrows()):
+            expected = _expected_properties(peptide)
+            for col, value in expected.items():
+                self.assertAlmostEqual(row[col], value, places=6, msg=f"{peptide} {col}")
+
+    def test_non_canonical_residues_get_zeros(self):
+        row = FastaProcessor.calculate_physchem_batch(['PEPTXDE', '']).iloc[0]
+        self.assertEqual(row['length'], 7)
+        for col in ("mw", "pI", "gravy", "instability_index", "aliphatic_index"):
+            self.assertEqual(row[col], 0.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
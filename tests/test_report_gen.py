@@ -0,0 +1,27 @@
+import unittest
+import numpy as np
+from report_gen import _format_table_value
+from src.pdf_generator import _format_cell
+
+
+class TestFormatTableValue(unittest.TestCase):
+    def test_python_scalars(self):
+        self.assertEqual(_format_table_value(12.345678, 'affinity_nm'), "12.35")
+        self.assertEqual(_format_table_value(0.91234, 'mhc_score'), "0.912")
+        self.assertEqual(_format_table_value(float('nan'), 'mhc_score'), "-")
+
+    def test_numpy_float32_scalars(self):
+        # Colunas rebaixadas para float32 chegam como escalares NumPy via to_numpy()
+        self.assertEqual(_format_table_value(np.float32(12.345678), 'affinity_nm'), "12.35")
+        self.assertEqual(_format_table_value(np.float32(0.91234), 'mhc_score'), "0.912")
+        self.assertEqual(_format_table_value(np.float32(0.5), 'percentile_rank'), "0.500")
+        self.assertEqual(_format_table_value(np.int64(3), 'final_rank_score'), "3.000")
+
+    def test_src_format_cell_numpy_scalars(self):
+        self.assertEqual(_format_cell(np.float32(12.345678), 'affinity_nm'), "12.35")
+        self.assertEqual(_format_cell(np.float32(0.5), 'percentile_rank'), "0.500")
+        self.assertEqual(_format_cell('PEPTIDESEQUENCELONG', 'peptide'), "PEPTIDESEQUENCE")
+
+
+if __name__ == '__main__':
+    unittest.main()